@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""Address activity rows written by the sync process.
+
+Every transaction that pays to or spends from an address gets one
+`AddressActivity` row per direction with the summed value. Rows belong to the
+block of the transaction and are removed with it on chain reorganizations.
+"""
+
+from collections import defaultdict
+from mex.models import AddressActivity
+
+
+ACTIVITY_FIELDS = ("address_id", "block_id", "txid", "direction", "value")
+
+
+def activity_rows(received=(), sent=()):
+    """Aggregate (address, height, txid, value) items to `AddressActivity` rows."""
+    totals = defaultdict(int)
+    for direction, items in (
+        (AddressActivity.RECEIVED, received),
+        (AddressActivity.SENT, sent),
+    ):
+        for address, height, txid, value in items:
+            if address:
+                totals[(address, height, txid, direction)] += value or 0
+    return [key + (value,) for key, value in totals.items()]
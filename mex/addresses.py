@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import logging
+from collections import OrderedDict
+from django.conf import settings
+from mex.models import Address
+
+
+log = logging.getLogger(__name__)
+
+
+class AddressRegistry:
+    """Bounded LRU cache of addresses known to exist in the database.
+
+    Addresses missing from the cache are upserted in one batch with
+    `bulk_create(ignore_conflicts=True)`, so the cache never has to be
+    primed from the full address table.
+    """
+
+    def __init__(self, max_size=settings.MEX_SYNC_ADDRESS_CACHE_SIZE, batch_size=1000):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self._known = OrderedDict()
+
+    def __len__(self):
+        return len(self._known)
+
+    def __contains__(self, address):
+        return address in self._known
+
+    def clear(self):
+        self._known.clear()
+
+    def ensure(self, addresses):
+        """Make sure all `addresses` exist in the database.
+
+        Returns the number of addresses that were upserted.
+        """
+        new = []
+        for address in addresses:
+            if not address:
+                continue
+            if address in self._known:
+                self._known.move_to_end(address)
+            else:
+                self._known[address] = None
+                new.append(address)
+
+        if new:
+            # sorted inserts avoid deadlocks between concurrent sync processes
+            Address.objects.bulk_create(
+                [Address(address=address) for address in sorted(new)],
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+
+        while len(self._known) > self.max_size:
+            self._known.popitem(last=False)
+
+        return len(new)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Incrementally maintained address balances.
+
+The sync process credits `AddressBalance` rows with the value of new outputs
+and debits them with the value of outputs that are flagged as spent. On chain
+reorganizations `rollback_balances` reverts the changes of orphaned blocks.
+"""
+
+import logging
+from collections import defaultdict
+from django.db import connection
+from django.db.models import F
+from mex.models import AddressBalance, Output
+
+
+log = logging.getLogger(__name__)
+
+
+UPDATE_BALANCES_SQL = """
+INSERT INTO mex_addressbalance (address_id, balance)
+SELECT address_id, change FROM (VALUES {values}) AS changes (address_id, change)
+ORDER BY address_id
+ON CONFLICT (address_id)
+DO UPDATE SET balance = mex_addressbalance.balance + EXCLUDED.balance
+"""
+
+
+def tally(credits=(), debits=()):
+    """Sum (address, value) pairs to a dict of balance changes per address."""
+    changes = defaultdict(int)
+    for address, value in credits:
+        if address:
+            changes[address] += value or 0
+    for address, value in debits:
+        if address:
+            changes[address] -= value or 0
+    return changes
+
+
+def update_balances(changes):
+    """Add `changes` (a dict of address to value) to the address balances.
+
+    Rows are locked in address order so that concurrent sync processes do not
+    deadlock.
+    """
+    if not changes:
+        return
+
+    changes = sorted(changes.items())
+    if connection.vendor != "postgresql":
+        for address, change in changes:
+            AddressBalance.objects.get_or_create(address_id=address)
+            AddressBalance.objects.filter(address_id=address).update(
+                balance=F("balance") + change
+            )
+        return
+
+    values = ", ".join(["(%s::varchar, %s::numeric)"] * len(changes))
+    params = [item for change in changes for item in change]
+    with connection.cursor() as cursor:
+        cursor.execute(UPDATE_BALANCES_SQL.format(values=values), params)
+
+
+def rollback_balances(fork_height):
+    """Revert balance changes of all blocks from `fork_height` on.
+
+    Must run before the blocks are deleted. Outputs of older blocks spent by
+    the orphaned blocks are flagged unspent again.
+    """
+    orphaned = Output.objects.filter(
+        transaction__block__height__gte=fork_height, spent=False
+    )
+    restored = Output.objects.filter(
+        transaction__block__height__lt=fork_height,
+        inputs_for_output__transaction__block__height__gte=fork_height,
+    )
+    changes = tally(
+        credits=restored.values_list("address_id", "value"),
+        debits=orphaned.values_list("address_id", "value"),
+    )
+    restored.update(spent=False)
+    update_balances(changes)
@@ -4,14 +4,76 @@
 Credits for BinaryHashField to:
 https://github.com/Racum/django-binhash (3-Clause BSD License)
 """
-import re
-import binascii
 from django.core import validators
 from django.db.models.fields import Field
 from django.core.exceptions import ValidationError
 
 
-HEXADECIMAL_VALUES = re.compile(r"^[0-9a-fA-F]+\Z")
+class HashValue:
+    """
+    Hash loaded from the database.
+
+    Keeps the raw bytes (or memoryview) from the database driver and converts
+    them to the hex string only when the value is first used as a string. It
+    compares and hashes equal to its hex string and is stored again without
+    validation.
+    """
+
+    __slots__ = ("raw", "_hex")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._hex = None
+
+    @property
+    def hex(self):
+        if self._hex is None:
+            self._hex = self.raw.hex()
+        return self._hex
+
+    def __str__(self):
+        return self.hex
+
+    def __repr__(self):
+        return "HashValue(%r)" % self.hex
+
+    def __eq__(self, other):
+        if isinstance(other, HashValue):
+            return self.hex == other.hex
+        if isinstance(other, str):
+            return len(other) == len(self.raw) * 2 and self.hex == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.hex)
+
+    def __len__(self):
+        return len(self.raw) * 2
+
+    def __getitem__(self, item):
+        return self.hex[item]
+
+    def __add__(self, other):
+        return self.hex + other
+
+    def __radd__(self, other):
+        return other + self.hex
+
+    def __getattr__(self, name):
+        # str methods like upper() or startswith()
+        if name.startswith("_") or name in HashValue.__slots__:
+            raise AttributeError(name)
+        return getattr(self.hex, name)
+
+    def __reduce__(self):
+        return HashValue, (bytes(self.raw),)
+
+
+def hash_bytes(value):
+    """Return the raw bytes of a hex string or `HashValue` without validation."""
+    if isinstance(value, HashValue):
+        return value.raw
+    return bytes.fromhex(value)
 
 
 class BinaryHashField(Field):
@@ -27,18 +89,20 @@ class BinaryHashField(Field):
         return "BinaryField"
 
     def hex_to_bytes(self, value):
-        if value is None:
-            return value
-        elif (
-            isinstance(value, str)
-            and len(value) == self.hex_length
-            and HEXADECIMAL_VALUES.search(str(value))
-        ):
-            return binascii.unhexlify(value)
-        else:
-            message_tpl = "Enter a valid {alg} (hexadecimal string with {size} bytes)."
-            message = message_tpl.format(alg=self.algorithm, size=self.hex_length)
-            raise ValidationError(message)
+        if value is None or isinstance(value, HashValue):
+            return value if value is None else value.raw
+        if isinstance(value, str) and len(value) == self.hex_length:
+            try:
+                # fromhex also accepts whitespace, which the length check rules out
+                raw = bytes.fromhex(value)
+            except ValueError:
+                pass
+            else:
+                if len(raw) * 2 == self.hex_length:
+                    return raw
+        message_tpl = "Enter a valid {alg} (hexadecimal string with {size} bytes)."
+        message = message_tpl.format(alg=self.algorithm, size=self.hex_length)
+        raise ValidationError(message)
 
     def get_db_prep_value(self, value, connection, prepared=False):
         value = super(BinaryHashField, self).get_db_prep_value(
@@ -48,11 +112,12 @@ class BinaryHashField(Field):
             return connection.Database.Binary(self.hex_to_bytes(value))
 
     def from_db_value(self, value, expression, connection, context):
-        if value not in self.empty_values:
-            return binascii.hexlify(value).decode("ascii")
+        if value is not None:
+            return HashValue(value)
 
     def to_python(self, value):
-        self.hex_to_bytes(value)
+        if not isinstance(value, HashValue):
+            self.hex_to_bytes(value)
         return value
 
     def get_default(self):
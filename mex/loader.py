@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""Bulk row loaders for the sync process.
+
+Loaders insert plain row tuples for a model and return the primary keys of
+the inserted rows. `OrmLoader` works on every database via `bulk_create`.
+`CopyLoader` streams rows into PostgreSQL with `COPY ... FROM STDIN` in text
+or binary format and skips model instantiation and field conversion.
+
+`link_spends` links inputs to the outputs they spend and flags those outputs
+as spent with a single set-based statement. `link_pending_spends` does the
+same for inputs whose linking was deferred during a parallel sync.
+"""
+
+import io
+import logging
+import struct
+from datetime import datetime, timedelta
+from decimal import Decimal
+import pytz
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import AutoField
+from mex.activity import ACTIVITY_FIELDS, activity_rows
+from mex.balances import tally, update_balances
+from mex.fields import BinaryHashField, hash_bytes
+from mex.models import AddressActivity, Input, Output, PendingSpend, Transaction
+
+
+log = logging.getLogger(__name__)
+
+
+def get_loader(backend=None):
+    """Return loader for `backend` ("orm", "copy" or "copy-binary").
+
+    Falls back to the ORM loader if the database is not PostgreSQL.
+    """
+    backend = backend or settings.MEX_SYNC_LOADER
+    if backend.startswith("copy") and connection.vendor == "postgresql":
+        return CopyLoader(binary=backend == "copy-binary")
+    return OrmLoader()
+
+
+LINK_SPENDS_SQL = """
+WITH spends (input_id, txid, vout, output_id) AS ({spends}),
+linked AS (
+    UPDATE mex_input SET spends_id = mex_output.id
+    FROM spends
+    JOIN mex_transaction ON mex_transaction.hash = spends.txid
+    JOIN mex_output
+        ON mex_output.transaction_id = mex_transaction.id
+        AND mex_output.out_idx = spends.vout
+    WHERE mex_input.id = spends.input_id AND spends.output_id IS NULL
+    RETURNING mex_input.id AS input_id, mex_input.spends_id AS output_id
+),
+spent AS (
+    SELECT input_id, output_id FROM spends WHERE output_id IS NOT NULL
+    UNION ALL
+    SELECT input_id, output_id FROM linked
+)
+UPDATE mex_output SET spent = TRUE
+FROM spent JOIN mex_input ON mex_input.id = spent.input_id
+WHERE mex_output.id = spent.output_id
+RETURNING mex_output.address_id, mex_output.value, mex_input.transaction_id
+"""
+
+
+def link_spends(spends):
+    """Link inputs to spent outputs and flag those outputs as spent.
+
+    `spends` is a list of (input_id, txid, vout, output_id) tuples. Inputs
+    with an `output_id` of None are linked by joining on (txid, vout). Returns
+    (address_id, value, transaction_id) tuples of the outputs flagged as spent
+    where `transaction_id` is the spending transaction.
+    """
+    if not spends:
+        return []
+
+    if connection.vendor != "postgresql":
+        spent = []
+        for input_id, txid, vout, output_id in spends:
+            if output_id is None:
+                output_id = (
+                    Output.objects.filter(transaction__hash=txid, out_idx=vout)
+                    .values_list("id", flat=True)
+                    .first()
+                )
+                Input.objects.filter(id=input_id).update(spends_id=output_id)
+            if output_id is not None:
+                Output.objects.filter(id=output_id).update(spent=True)
+                address_id, value = Output.objects.values_list(
+                    "address_id", "value"
+                ).get(id=output_id)
+                tx_id = Input.objects.values_list("transaction_id", flat=True).get(
+                    id=input_id
+                )
+                spent.append((address_id, value, tx_id))
+        return spent
+
+    values = ", ".join(
+        ["(%s::integer, %s::bytea, %s::integer, %s::integer)"] * len(spends)
+    )
+    params = []
+    for input_id, txid, vout, output_id in spends:
+        params.extend((input_id, bytes.fromhex(txid), vout, output_id))
+    with connection.cursor() as cursor:
+        cursor.execute(LINK_SPENDS_SQL.format(spends="VALUES " + values), params)
+        return cursor.fetchall()
+
+
+def link_pending_spends():
+    """Link all inputs recorded as `PendingSpend` and flag their outputs as spent.
+
+    Pending spends that could be linked are deleted, the balances of the spent
+    outputs are debited and their address activity is recorded. Returns the
+    number of pending spends left unlinked.
+    """
+    if not PendingSpend.objects.exists():
+        return 0
+
+    with transaction.atomic():
+        if connection.vendor != "postgresql":
+            pending = PendingSpend.objects.values_list("input_id", "txid", "vout")
+            spent = link_spends([row + (None,) for row in pending])
+        else:
+            spends = "SELECT input_id, txid, vout, NULL::integer FROM mex_pendingspend"
+            with connection.cursor() as cursor:
+                cursor.execute(LINK_SPENDS_SQL.format(spends=spends))
+                spent = cursor.fetchall()
+        update_balances(tally(debits=[row[:2] for row in spent]))
+
+        spending_txs = Transaction.objects.filter(id__in={row[2] for row in spent})
+        txs = {
+            tx_id: (height, txid)
+            for tx_id, height, txid in spending_txs.values_list("id", "block", "hash")
+        }
+        sent = [(address, *txs[tx_id], value) for address, value, tx_id in spent]
+        get_loader().insert(AddressActivity, ACTIVITY_FIELDS, activity_rows(sent=sent))
+
+        PendingSpend.objects.filter(input__spends__isnull=False).delete()
+    return PendingSpend.objects.count()
+
+
+class OrmLoader:
+    """Insert rows with `bulk_create`."""
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+
+    def insert(self, model, fields, rows):
+        objs = [model(**dict(zip(fields, row))) for row in rows]
+        model.objects.bulk_create(objs, batch_size=self.batch_size)
+        # only postgres sets primary ids for objs here.
+        return [obj.pk for obj in objs]
+
+
+class CopyLoader:
+    """Insert rows with PostgreSQL `COPY ... FROM STDIN`.
+
+    Primary keys of auto incremented models are reserved from the table
+    sequence up front so that they can be returned to the caller.
+    """
+
+    def __init__(self, binary=False):
+        self.binary = binary
+
+    def insert(self, model, fields, rows):
+        rows = list(rows)
+        if not rows:
+            return []
+
+        fields = tuple(fields)
+        pk = model._meta.pk
+        if pk.attname in fields:
+            pk_idx = fields.index(pk.attname)
+            ids = [row[pk_idx] for row in rows]
+        elif isinstance(pk, AutoField):
+            ids = self.reserve_ids(model, len(rows))
+            fields = (pk.attname,) + fields
+            rows = [(pk_id,) + tuple(row) for pk_id, row in zip(ids, rows)]
+        else:
+            raise ValueError("Primary key of %s missing in fields" % model.__name__)
+
+        # fill in model defaults for omitted fields like bulk_create would
+        omitted = [
+            f
+            for f in model._meta.concrete_fields
+            if f.attname not in fields and f is not pk
+        ]
+        if omitted:
+            fields += tuple(f.attname for f in omitted)
+            defaults = tuple(f.get_default() for f in omitted)
+            rows = [tuple(row) + defaults for row in rows]
+
+        model_fields = [model._meta.get_field(f) for f in fields]
+        columns = ", ".join(connection.ops.quote_name(f.column) for f in model_fields)
+        table = connection.ops.quote_name(model._meta.db_table)
+        if self.binary:
+            data = self._encode_binary(model_fields, rows)
+            sql = "COPY %s (%s) FROM STDIN WITH (FORMAT binary)" % (table, columns)
+        else:
+            data = self._encode_text(model_fields, rows)
+            sql = "COPY %s (%s) FROM STDIN" % (table, columns)
+
+        with connection.cursor() as cursor:
+            cursor.copy_expert(sql, data)
+        return ids
+
+    def reserve_ids(self, model, count):
+        sql = (
+            "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [model._meta.db_table, model._meta.pk.column, count])
+            return [row[0] for row in cursor.fetchall()]
+
+    def _encode_text(self, model_fields, rows):
+        encoders = [text_encoder(f) for f in model_fields]
+        lines = []
+        for row in rows:
+            cells = [
+                "\\N" if value is None else encode(value)
+                for encode, value in zip(encoders, row)
+            ]
+            lines.append("\t".join(cells))
+        lines.append("")
+        return io.StringIO("\n".join(lines))
+
+    def _encode_binary(self, model_fields, rows):
+        encoders = [binary_encoder(f) for f in model_fields]
+        buffer = io.BytesIO()
+        write = buffer.write
+        write(b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0))
+        row_header = struct.pack("!h", len(encoders))
+        null = struct.pack("!i", -1)
+        for row in rows:
+            write(row_header)
+            for encode, value in zip(encoders, row):
+                if value is None:
+                    write(null)
+                else:
+                    data = encode(value)
+                    write(struct.pack("!i", len(data)))
+                    write(data)
+        write(struct.pack("!h", -1))
+        buffer.seek(0)
+        return buffer
+
+
+def _db_type(field):
+    return field.db_type(connection).split("(")[0]
+
+
+def _is_hash(field):
+    target = field.target_field if field.is_relation else field
+    return isinstance(target, BinaryHashField)
+
+
+TEXT_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def text_encoder(field):
+    db_type = _db_type(field)
+    if _is_hash(field):
+        return lambda value: "\\\\x" + value
+    if db_type == "boolean":
+        return lambda value: "t" if value else "f"
+    if db_type == "timestamp with time zone":
+        return datetime.isoformat
+    if db_type in ("varchar", "text"):
+        return lambda value: value.translate(TEXT_ESCAPES)
+    return str
+
+
+EPOCH = datetime(2000, 1, 1, tzinfo=pytz.utc)
+
+INT_FORMATS = {
+    "smallint": struct.Struct("!h"),
+    "integer": struct.Struct("!i"),
+    "serial": struct.Struct("!i"),
+    "bigint": struct.Struct("!q"),
+    "bigserial": struct.Struct("!q"),
+}
+
+
+def binary_encoder(field):
+    db_type = _db_type(field)
+    if _is_hash(field):
+        return hash_bytes
+    if db_type in INT_FORMATS:
+        return INT_FORMATS[db_type].pack
+    if db_type == "boolean":
+        return lambda value: b"\x01" if value else b"\x00"
+    if db_type == "timestamp with time zone":
+        return lambda value: struct.pack(
+            "!q", (value - EPOCH) // timedelta(microseconds=1)
+        )
+    if db_type == "numeric":
+        return encode_numeric
+    if db_type in ("varchar", "text"):
+        return str.encode
+    raise ValueError("No binary COPY encoder for %s" % field)
+
+
+def encode_numeric(value):
+    """Encode a decimal in the PostgreSQL binary numeric format (base 10000)."""
+    sign, digits, exponent = Decimal(value).as_tuple()
+    digits = "".join(map(str, digits))
+    if exponent > 0:
+        digits += "0" * exponent
+        exponent = 0
+    scale = -exponent
+    digits = digits.rjust(scale + 1, "0")
+    int_part = digits[: len(digits) - scale].lstrip("0")
+    frac_part = digits[len(digits) - scale :]
+    int_part = int_part.rjust(-(-len(int_part) // 4) * 4, "0")
+    frac_part = frac_part.ljust(-(-len(frac_part) // 4) * 4, "0")
+    weight = len(int_part) // 4 - 1
+    groups = [int(int_part[i : i + 4]) for i in range(0, len(int_part), 4)]
+    groups += [int(frac_part[i : i + 4]) for i in range(0, len(frac_part), 4)]
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        weight = 0
+    header = struct.pack("!hhhh", len(groups), weight, 0x4000 if sign else 0, scale)
+    return header + struct.pack("!%dh" % len(groups), *groups)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from django.core.management import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connection
+from mex.partitions import MIN_PG_VERSION, partition_tables
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert the output and input tables to tables partitioned by id ranges "
+        "(requires PostgreSQL 12 or later)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size",
+            type=int,
+            default=settings.MEX_PARTITION_SIZE,
+            help="number of ids per partition (default: MEX_PARTITION_SIZE)",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Partitioning requires PostgreSQL")
+        if connection.pg_version < MIN_PG_VERSION:
+            raise CommandError("Partitioning requires PostgreSQL 12 or later")
+        if not options["size"]:
+            raise CommandError("Set MEX_PARTITION_SIZE or pass --size")
+        partition_tables(options["size"])
+        print("  Partitioned tables with %s ids per partition" % options["size"])
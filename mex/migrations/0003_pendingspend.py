@@ -0,0 +1,23 @@
+# Generated by Django 2.2.12 on 2026-10-18 03:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+import mex.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mex', '0002_auto_20200505_1420'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingSpend',
+            fields=[
+                ('input', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='mex.Input')),
+                ('txid', mex.fields.SHA256Field(max_length=64)),
+                ('vout', models.PositiveSmallIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 2.2.12 on 2026-10-18 03:40
+
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+
+def mark_ingested_blocks(apps, schema_editor):
+    Block = apps.get_model("mex", "Block")
+    SyncState = apps.get_model("mex", "SyncState")
+    Block.objects.filter(transactions__isnull=False).update(ingested=True)
+    heights = Block.objects.aggregate(tip=Max("height"))
+    pending = Block.objects.filter(ingested=False).aggregate(first=Min("height"))
+    if pending["first"] is not None:
+        height = pending["first"] - 1
+    elif heights["tip"] is not None:
+        height = heights["tip"]
+    else:
+        height = -1
+    SyncState.objects.create(name="transactions", height=height)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mex', '0003_pendingspend'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('name', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('height', models.IntegerField(default=-1)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='block',
+            name='ingested',
+            field=models.BooleanField(default=False, help_text='Transactions, inputs and outputs are imported.'),
+        ),
+        migrations.AddIndex(
+            model_name='block',
+            index=models.Index(condition=models.Q(ingested=False), fields=['height'], name='mex_block_not_ingested_idx'),
+        ),
+        migrations.RunPython(mark_ingested_blocks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.12 on 2026-10-18 03:44
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+import mex.fields
+
+
+def link_previous_blocks(apps, schema_editor):
+    Block = apps.get_model("mex", "Block")
+    parents = Block.objects.filter(height=OuterRef("height") - 1).values("hash")
+    Block.objects.filter(height__gt=0).update(previousblockhash=Subquery(parents[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mex', '0004_auto_20261018_0340'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='block',
+            name='previousblockhash',
+            field=mex.fields.SHA256Field(max_length=64, null=True),
+        ),
+        migrations.RunPython(link_previous_blocks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 2.2.12 on 2026-10-18 03:47
+
+from django.db import migrations, models
+from django.db.models import Q, Sum
+import django.db.models.deletion
+
+
+def compute_balances(apps, schema_editor):
+    Address = apps.get_model("mex", "Address")
+    AddressBalance = apps.get_model("mex", "AddressBalance")
+    balances = Address.objects.annotate(
+        balance=Sum("outputs_for_addr__value", filter=Q(outputs_for_addr__spent=False))
+    ).values_list("address", "balance")
+    AddressBalance.objects.bulk_create(
+        [AddressBalance(address_id=a, balance=b or 0) for a, b in balances.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mex', '0005_block_previousblockhash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AddressBalance',
+            fields=[
+                ('address', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='mex.Address')),
+                ('balance', models.DecimalField(decimal_places=8, default=0, max_digits=28)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='addressbalance',
+            index=models.Index(fields=['-balance'], name='mex_balance_idx'),
+        ),
+        migrations.RunPython(compute_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 2.2.12 on 2026-10-18 03:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+import mex.fields
+
+
+# Existing transactions are numbered in chain order. Deferred foreign key
+# checks are flushed after each data update so that the following schema
+# changes do not run into pending trigger events.
+
+NUMBER_TRANSACTIONS = """
+UPDATE mex_transaction SET id = numbered.id
+FROM (
+    SELECT hash, row_number() OVER (ORDER BY block_id, idx) AS id
+    FROM mex_transaction
+) AS numbered
+WHERE mex_transaction.hash = numbered.hash;
+SET CONSTRAINTS ALL IMMEDIATE;
+"""
+
+LINK_TRANSACTION_IDS = """
+UPDATE mex_output SET transaction_key = mex_transaction.id
+FROM mex_transaction WHERE mex_transaction.hash = mex_output.transaction_id;
+UPDATE mex_input SET transaction_key = mex_transaction.id
+FROM mex_transaction WHERE mex_transaction.hash = mex_input.transaction_id;
+SET CONSTRAINTS ALL IMMEDIATE;
+"""
+
+SWAP_PRIMARY_KEY = """
+ALTER TABLE mex_transaction DROP CONSTRAINT mex_transaction_pkey;
+ALTER TABLE mex_transaction ADD CONSTRAINT mex_transaction_pkey PRIMARY KEY (id);
+ALTER TABLE mex_transaction ADD CONSTRAINT mex_transaction_hash_key UNIQUE (hash);
+CREATE SEQUENCE mex_transaction_id_seq OWNED BY mex_transaction.id;
+SELECT setval('mex_transaction_id_seq', COALESCE(max(id), 0) + 1, false)
+FROM mex_transaction;
+ALTER TABLE mex_transaction
+    ALTER COLUMN id SET DEFAULT nextval('mex_transaction_id_seq');
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mex', '0006_auto_20261018_0347'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='id',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.RunSQL(NUMBER_TRANSACTIONS, migrations.RunSQL.noop),
+        migrations.AddField(
+            model_name='output',
+            name='transaction_key',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='input',
+            name='transaction_key',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.RunSQL(LINK_TRANSACTION_IDS, migrations.RunSQL.noop),
+        migrations.RemoveField(
+            model_name='output',
+            name='transaction',
+        ),
+        migrations.RemoveField(
+            model_name='input',
+            name='transaction',
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunSQL(SWAP_PRIMARY_KEY)],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='transaction',
+                    name='hash',
+                    field=mex.fields.SHA256Field(max_length=64, unique=True),
+                ),
+                migrations.AlterField(
+                    model_name='transaction',
+                    name='id',
+                    field=models.BigAutoField(primary_key=True, serialize=False),
+                ),
+            ],
+        ),
+        migrations.RenameField(
+            model_name='output',
+            old_name='transaction_key',
+            new_name='transaction',
+        ),
+        migrations.RenameField(
+            model_name='input',
+            old_name='transaction_key',
+            new_name='transaction',
+        ),
+        migrations.AlterField(
+            model_name='output',
+            name='transaction',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outputs_for_tx', to='mex.Transaction'),
+        ),
+        migrations.AlterField(
+            model_name='input',
+            name='transaction',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inputs_for_tx', to='mex.Transaction'),
+        ),
+    ]
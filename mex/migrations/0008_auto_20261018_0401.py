@@ -0,0 +1,54 @@
+# Generated by Django 2.2.12 on 2026-10-18 04:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+import mex.fields
+
+
+RECORD_ACTIVITY = """
+INSERT INTO mex_addressactivity (address_id, block_id, txid, direction, value)
+SELECT mex_output.address_id, mex_transaction.block_id, mex_transaction.hash,
+    'in', COALESCE(SUM(mex_output.value), 0)
+FROM mex_output
+JOIN mex_transaction ON mex_transaction.id = mex_output.transaction_id
+WHERE mex_output.address_id IS NOT NULL
+GROUP BY 1, 2, 3
+UNION ALL
+SELECT mex_output.address_id, mex_transaction.block_id, mex_transaction.hash,
+    'out', COALESCE(SUM(mex_output.value), 0)
+FROM mex_input
+JOIN mex_output ON mex_output.id = mex_input.spends_id
+JOIN mex_transaction ON mex_transaction.id = mex_input.transaction_id
+WHERE mex_output.address_id IS NOT NULL
+GROUP BY 1, 2, 3
+ORDER BY 2, 3;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mex', '0007_transaction_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AddressActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('txid', mex.fields.SHA256Field(max_length=64)),
+                ('direction', models.CharField(choices=[('in', 'received'), ('out', 'sent')], max_length=3)),
+                ('value', models.DecimalField(decimal_places=8, default=0, max_digits=28)),
+                ('address', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='mex.Address')),
+                ('block', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='mex.Block')),
+            ],
+            options={
+                'ordering': ('-block', '-id'),
+            },
+        ),
+        migrations.RunSQL(RECORD_ACTIVITY, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='addressactivity',
+            index=models.Index(fields=['address', '-block', '-id'], name='mex_activity_address_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.12 on 2026-10-18 04:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mex', '0008_auto_20261018_0401'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='addressbalance',
+            name='mex_balance_idx',
+        ),
+        migrations.AddIndex(
+            model_name='addressbalance',
+            index=models.Index(fields=['-balance', 'address'], name='mex_balance_idx'),
+        ),
+    ]
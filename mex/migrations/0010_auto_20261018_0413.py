@@ -0,0 +1,66 @@
+# Generated by Django 2.2.12 on 2026-10-18 04:13
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.fields.jsonb
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+import mex.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mex', '0009_auto_20261018_0411'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Stream',
+            fields=[
+                ('name', models.CharField(max_length=256, primary_key=True, serialize=False)),
+                ('createtxid', mex.fields.SHA256Field(max_length=64, null=True)),
+                ('details', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('restrict', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('creators', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=52), default=list, size=None)),
+                ('items', models.PositiveIntegerField(default=0, help_text='Number of confirmed stream items indexed.')),
+            ],
+            options={
+                'ordering': ('name',),
+            },
+        ),
+        migrations.CreateModel(
+            name='StreamItem',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('txid', mex.fields.SHA256Field(max_length=64)),
+                ('vout', models.PositiveIntegerField()),
+                ('keys', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=256), default=list, size=None)),
+                ('publishers', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=52), default=list, size=None)),
+                ('data', django.contrib.postgres.fields.jsonb.JSONField(null=True)),
+                ('offchain', models.BooleanField(default=False)),
+                ('time', models.DateTimeField()),
+                ('block', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stream_items', to='mex.Block')),
+                ('stream', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stream_items', to='mex.Stream')),
+            ],
+            options={
+                'ordering': ('-id',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='streamitem',
+            index=models.Index(fields=['stream', '-id'], name='mex_streamitem_stream_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='streamitem',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['keys'], name='mex_streamitem_keys_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='streamitem',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['publishers'], name='mex_streamitem_publishers_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='streamitem',
+            unique_together={('txid', 'vout')},
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.12 on 2026-10-18 04:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mex', '0010_auto_20261018_0413'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Permission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=52)),
+                ('type', models.CharField(max_length=16)),
+                ('startblock', models.BigIntegerField()),
+                ('endblock', models.BigIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='permission',
+            index=models.Index(fields=['address', 'type'], name='mex_permission_address_idx'),
+        ),
+    ]
@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 from django.db import models
-from django.db.models import SET_NULL, CASCADE
+from django.db.models import SET_NULL, CASCADE, Q
 from django.urls import reverse
 from django.contrib.postgres import fields as pg_models
+from django.contrib.postgres.indexes import GinIndex
 from mex.fields import SHA256Field
-from mex.querysets import AddressQuerySet
+from mex.querysets import AddressQuerySet, PermissionQuerySet
 
 
 class Block(models.Model):
@@ -16,15 +17,26 @@ class Block(models.Model):
     time = models.DateTimeField()
     txcount = models.PositiveSmallIntegerField()
     size = models.PositiveIntegerField()
+    previousblockhash = SHA256Field(null=True)
+    ingested = models.BooleanField(
+        default=False, help_text="Transactions, inputs and outputs are imported."
+    )
 
     class Meta:
         get_latest_by = "height"
+        indexes = [
+            models.Index(
+                fields=["height"],
+                name="mex_block_not_ingested_idx",
+                condition=Q(ingested=False),
+            )
+        ]
 
     def __str__(self):
         return "Block(%s)" % self.height
 
     def natural_key(self):
-        return self.hash
+        return str(self.hash)
 
     def get_absolute_url(self):
         return reverse("block-detail", args=[str(self.hash)])
@@ -39,7 +51,8 @@ class Block(models.Model):
 
 class Transaction(models.Model):
 
-    hash = SHA256Field(primary_key=True)
+    id = models.BigAutoField(primary_key=True)
+    hash = SHA256Field(unique=True)
     block = models.ForeignKey(
         Block, on_delete=CASCADE, null=True, related_name="transactions"
     )
@@ -49,10 +62,10 @@ class Transaction(models.Model):
         ordering = ("-block", "idx")
 
     def __str__(self):
-        return self.hash
+        return str(self.hash)
 
     def natural_key(self):
-        return self.hash
+        return str(self.hash)
 
     def get_absolute_url(self):
         return reverse("transaction-detail", args=[str(self.hash)])
@@ -73,6 +86,19 @@ class Address(models.Model):
         return reverse("address-detail", args=[str(self.address)])
 
 
+class AddressBalance(models.Model):
+    """Unspent balance of an address maintained by the sync process."""
+
+    address = models.OneToOneField(Address, on_delete=CASCADE, primary_key=True)
+    balance = models.DecimalField(max_digits=28, decimal_places=8, default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["-balance", "address"], name="mex_balance_idx")]
+
+    def __str__(self):
+        return "%s: %s" % (self.address_id, self.balance)
+
+
 class Output(models.Model):
 
     transaction = models.ForeignKey(
@@ -122,3 +148,138 @@ class Input(models.Model):
             return self.spends.value
         else:
             return 0
+
+
+class AddressActivity(models.Model):
+    """Value an address received or sent in a transaction."""
+
+    RECEIVED = "in"
+    SENT = "out"
+    DIRECTIONS = ((RECEIVED, "received"), (SENT, "sent"))
+
+    address = models.ForeignKey(
+        Address, on_delete=CASCADE, related_name="activity", db_index=False
+    )
+    block = models.ForeignKey(Block, on_delete=CASCADE, related_name="activity")
+    txid = SHA256Field()
+    direction = models.CharField(max_length=3, choices=DIRECTIONS)
+    value = models.DecimalField(max_digits=28, decimal_places=8, default=0)
+
+    class Meta:
+        ordering = ("-block", "-id")
+        indexes = [
+            models.Index(
+                fields=["address", "-block", "-id"], name="mex_activity_address_idx"
+            )
+        ]
+
+    def __str__(self):
+        return "%s %s %s" % (self.address_id, self.direction, self.value)
+
+
+class PendingSpend(models.Model):
+    """Input whose spent output is linked after a parallel sync."""
+
+    input = models.OneToOneField(Input, on_delete=CASCADE, primary_key=True)
+    txid = SHA256Field()
+    vout = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return "%s:%s" % (self.txid, self.vout)
+
+
+class Permission(models.Model):
+    """Permission of an address as listed by the node, kept by the sync process."""
+
+    MINE = "mine"
+    ADMIN = "admin"
+
+    address = models.CharField(max_length=52)
+    type = models.CharField(max_length=16)
+    startblock = models.BigIntegerField()
+    endblock = models.BigIntegerField()
+    objects = PermissionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["address", "type"], name="mex_permission_address_idx")
+        ]
+
+    def __str__(self):
+        return "%s %s" % (self.address, self.type)
+
+
+class Stream(models.Model):
+    """Stream whose items are indexed by the sync process."""
+
+    name = models.CharField(max_length=256, primary_key=True)
+    createtxid = SHA256Field(null=True)
+    details = pg_models.JSONField(default=dict)
+    restrict = pg_models.JSONField(default=dict)
+    creators = pg_models.ArrayField(models.CharField(max_length=52), default=list)
+    items = models.PositiveIntegerField(
+        default=0, help_text="Number of confirmed stream items indexed."
+    )
+
+    class Meta:
+        ordering = ("name",)
+
+    def __str__(self):
+        return self.name
+
+
+class StreamItem(models.Model):
+    """Confirmed stream item in chain order."""
+
+    id = models.BigAutoField(primary_key=True)
+    stream = models.ForeignKey(Stream, on_delete=CASCADE, related_name="stream_items")
+    block = models.ForeignKey(Block, on_delete=CASCADE, related_name="stream_items")
+    txid = SHA256Field()
+    vout = models.PositiveIntegerField()
+    keys = pg_models.ArrayField(models.CharField(max_length=256), default=list)
+    publishers = pg_models.ArrayField(models.CharField(max_length=52), default=list)
+    data = pg_models.JSONField(null=True)
+    offchain = models.BooleanField(default=False)
+    time = models.DateTimeField()
+
+    class Meta:
+        ordering = ("-id",)
+        unique_together = ("txid", "vout")
+        indexes = [
+            models.Index(fields=["stream", "-id"], name="mex_streamitem_stream_idx"),
+            GinIndex(fields=["keys"], name="mex_streamitem_keys_idx"),
+            GinIndex(fields=["publishers"], name="mex_streamitem_publishers_idx"),
+        ]
+
+    def __str__(self):
+        return "%s:%s" % (self.txid, self.vout)
+
+
+class SyncState(models.Model):
+    """Named sync cursor.
+
+    `height` is the last block height up to which all blocks have been fully
+    ingested by the sync step `name`.
+    """
+
+    name = models.CharField(max_length=32, primary_key=True)
+    height = models.IntegerField(default=-1)
+
+    def __str__(self):
+        return "SyncState(%s=%s)" % (self.name, self.height)
+
+    @classmethod
+    def get_height(cls, name):
+        state = cls.objects.filter(name=name).first()
+        return state.height if state else -1
+
+    @classmethod
+    def set_height(cls, name, height):
+        cls.objects.update_or_create(name=name, defaults={"height": height})
+
+    @classmethod
+    def advance(cls, name, height):
+        """Move cursor `name` to `height` if it directly follows the cursor."""
+        updated = cls.objects.filter(name=name, height=height - 1).update(height=height)
+        if not updated and height == 0:
+            cls.objects.get_or_create(name=name, defaults={"height": height})
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Block notifications for the sync process.
+
+With `MEX_SYNC_NOTIFY_PORT` configured `python -m mex.sync` listens for HTTP
+requests on that port and starts a sync round as soon as one arrives. Start
+the node with a block notification hook that calls the listener like:
+
+    -blocknotify="curl -s http://127.0.0.1:8375/%s"
+
+or:
+
+    -blocknotify="python -m mex.notify %s"
+"""
+
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import urlopen
+from django.conf import settings
+
+
+log = logging.getLogger(__name__)
+
+
+class BlockNotifyHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        log.debug("block notification %s" % self.path)
+        self.server.event.set()
+        self.send_response(204)
+        self.end_headers()
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+class BlockNotifyListener:
+    """Background HTTP listener that records incoming block notifications."""
+
+    def __init__(
+        self, host=settings.MEX_SYNC_NOTIFY_HOST, port=settings.MEX_SYNC_NOTIFY_PORT
+    ):
+        self.event = threading.Event()
+        self.server = ThreadingHTTPServer((host, port), BlockNotifyHandler)
+        self.server.event = self.event
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        log.info(
+            "listening for block notifications on %s:%s" % self.server.server_address
+        )
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wait(self, timeout=None):
+        """Wait up to `timeout` seconds for a notification.
+
+        Returns True if a notification arrived since the last call.
+        """
+        notified = self.event.wait(timeout)
+        self.event.clear()
+        return notified
+
+
+def notify(block_hash=""):
+    """Notify a running sync process about a new block."""
+    url = "http://%s:%s/%s" % (
+        settings.MEX_SYNC_NOTIFY_HOST,
+        settings.MEX_SYNC_NOTIFY_PORT,
+        block_hash,
+    )
+    urlopen(url, timeout=5).close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    notify(sys.argv[1] if len(sys.argv) > 1 else "")
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""Caching of pages that only change with new blocks.
+
+Cached pages are keyed by `tip_key`, a key for the newest block and the last
+fully ingested block in the database. The key itself is cached for
+`MEX_PAGE_TIP_TTL` seconds. The sync process deletes it whenever it commits
+blocks, so with a shared `MEX_PAGE_CACHE` pages are refreshed right away.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from mex.models import Block, SyncState
+
+
+TIP_KEY = "mex:pages:tip"
+
+
+def tip_key():
+    """Return a key that changes whenever new blocks or transactions are indexed."""
+    cache = caches[settings.MEX_PAGE_CACHE]
+    key = cache.get(TIP_KEY)
+    if key is None:
+        tip = Block.objects.order_by("-height").values_list("height", "hash").first()
+        height, block_hash = tip or (-1, "")
+        key = "%s-%s-%s" % (height, block_hash, SyncState.get_height("transactions"))
+        cache.set(TIP_KEY, key, settings.MEX_PAGE_TIP_TTL)
+    return key
+
+
+def invalidate_pages():
+    """Make the next request compute a new `tip_key`."""
+    caches[settings.MEX_PAGE_CACHE].delete(TIP_KEY)
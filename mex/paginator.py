@@ -1,13 +1,15 @@
 # -*- coding: utf-8 -*-
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
-from django.db import transaction, connection, OperationalError
+from django.db import transaction, connections, router, OperationalError
+from django.db.models import Q
 from django.utils.functional import cached_property
 
 from mex.rpc import get_client
 
 
 class StreamPaginator(Paginator):
-    """Paginator that gets its total count via chain api. """
+    """Paginator that gets its total count via chain api."""
 
     def __init__(self, *args, **kwargs):
         self.stream = kwargs.pop("stream")
@@ -24,16 +26,133 @@ class StreamPaginator(Paginator):
 
 class TimeLimitedPaginator(Paginator):
     """
-   Paginator that enforces a timeout on the count operation.
-   If the operations times out, a fake bogus value is
-   returned instead.
-   """
+    Paginator that enforces a timeout on the count operation.
+    If the operations times out, a fake bogus value is
+    returned instead.
+    """
 
     @cached_property
     def count(self):
-        with transaction.atomic(), connection.cursor() as cursor:
+        using = self.object_list.db
+        with transaction.atomic(using), connections[using].cursor() as cursor:
             cursor.execute("SET LOCAL statement_timeout TO 200;")
             try:
                 return super().count
             except OperationalError:
                 return 9999999
+
+
+def estimate_count(model):
+    """Return the planner estimate of the number of rows of `model`.
+
+    Returns None if the table was never analyzed.
+    """
+    with connections[router.db_for_read(model)].cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [model._meta.db_table],
+        )
+        count = cursor.fetchone()[0]
+    return count if count >= 0 else None
+
+
+class KeysetPage:
+    def __init__(self, paginator, object_list, has_next, has_previous):
+        self.paginator = paginator
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = paginator.cursor(object_list[-1]) if has_next else None
+        self.previous_cursor = (
+            paginator.cursor(object_list[0]) if has_previous else None
+        )
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginator that seeks to the rows after or before a cursor instead of
+    skipping rows with OFFSET, so deep pages are as cheap as the first one.
+
+    `keys` is the ordering of the queryset and must identify rows uniquely.
+    The cursor of a page boundary is the key of the row next to it. `count`
+    is an optional exact or estimated total that is only used for display.
+    """
+
+    separator = ","
+
+    def __init__(self, queryset, per_page, keys, after=None, before=None, count=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.keys = keys
+        self.after = after
+        self.before = before
+        self.count = count
+        self.fields = [self._field(key.lstrip("-")) for key in keys]
+
+    def _field(self, name):
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return name, annotation.output_field
+        field = self.queryset.model._meta.get_field(name)
+        return field.attname, field
+
+    def cursor(self, obj):
+        return self.separator.join(str(getattr(obj, attr)) for attr, _ in self.fields)
+
+    def parse(self, cursor):
+        values = cursor.split(self.separator)
+        if len(values) != len(self.fields):
+            raise ValidationError("Invalid cursor")
+        return [
+            field.to_python(value) for (_, field), value in zip(self.fields, values)
+        ]
+
+    def seek(self, cursor, forward=True):
+        """Return a filter for the rows after (or before) `cursor`."""
+        values = self.parse(cursor)
+        condition = Q()
+        for n, key in enumerate(self.keys):
+            name = key.lstrip("-")
+            lookup = "lt" if key.startswith("-") == forward else "gt"
+            equal = {k.lstrip("-"): v for k, v in zip(self.keys[:n], values)}
+            condition |= Q(**equal, **{"%s__%s" % (name, lookup): values[n]})
+        if len(self.keys) > 1:
+            # the OR above is no index condition, bound the first key so an index
+            # scan starts at the cursor instead of filtering all rows before it
+            first = self.keys[0]
+            bound = "lte" if first.startswith("-") == forward else "gte"
+            condition &= Q(**{"%s__%s" % (first.lstrip("-"), bound): values[0]})
+        return condition
+
+    def page(self):
+        qs = self.queryset
+        if self.before:
+            keys = [k[1:] if k.startswith("-") else "-" + k for k in self.keys]
+            qs = qs.filter(self.seek(self.before, forward=False)).order_by(*keys)
+            rows = list(qs[: self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[: self.per_page][::-1]
+            return KeysetPage(self, rows, bool(rows), has_previous)
+
+        qs = qs.order_by(*self.keys)
+        if self.after:
+            qs = qs.filter(self.seek(self.after))
+        rows = list(qs[: self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        return KeysetPage(self, rows, has_next, bool(self.after and rows))
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""Optional range partitioning of the output and input tables.
+
+`partition_tables` converts the tables of `PARTITIONED_MODELS` into
+PostgreSQL tables partitioned by ranges of `MEX_PARTITION_SIZE` ids. The tables
+are partitioned by id rather than by block height as their rows do not store
+the height and the primary key of a partitioned table has to include the
+partition key. Ids grow roughly with the height, so most reorgs only touch the
+newest partitions, but `sync_parallel` allocates ids out of height order.
+Transactions stay in a regular table. `ensure_partitions` creates the next
+partition ahead of the id sequence as the chain grows.
+
+Foreign keys referencing partitioned tables require PostgreSQL 12.
+"""
+
+import logging
+import re
+from django.conf import settings
+from django.db import connection, transaction
+from mex.models import Address, Input, Output, PendingSpend, Transaction
+
+
+log = logging.getLogger(__name__)
+
+
+PARTITIONED_MODELS = (Output, Input)
+
+# tables in the order the sync process writes to them. Partition creation locks
+# them in the same order so it does not deadlock with concurrent block imports.
+LOCKED_MODELS = (Transaction, Address, Output, Input, PendingSpend)
+
+# advisory lock key that serializes partition creation between sync processes
+PARTITION_LOCK = 0x6D6578
+
+# server_version_num of the first PostgreSQL release that supports foreign keys
+# referencing partitioned tables
+MIN_PG_VERSION = 120000
+
+# upper id bound of the newest partition per partitioned table
+_limits = None
+
+# ids per partitioned table this process may use before it reads the id
+# sequences again
+_budget = {}
+
+
+def is_partitioned(cursor, table):
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)",
+        [table],
+    )
+    return cursor.fetchone()[0]
+
+
+def partition_limit(cursor, table):
+    """Return the upper id bound of the newest partition of `table`."""
+    cursor.execute(
+        "SELECT pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass",
+        [table],
+    )
+    bounds = [re.search(r"TO \('?(-?\d+)'?\)", bound) for bound, in cursor]
+    return max((int(match.group(1)) for match in bounds if match), default=1)
+
+
+def create_partitions(cursor, table, size, upto):
+    """Append partitions of `size` ids to `table` until they cover id `upto`."""
+    start = partition_limit(cursor, table)
+    while start <= upto:
+        name = connection.ops.quote_name("%s_p%s" % (table, start))
+        cursor.execute(
+            "CREATE TABLE %s PARTITION OF %s FOR VALUES FROM (%s) TO (%s)"
+            % (name, connection.ops.quote_name(table), start, start + size)
+        )
+        log.info("created partition %s for ids %s-%s" % (name, start, start + size - 1))
+        start += size
+    return start
+
+
+def _next_ids(cursor, tables):
+    """Return the next id of the sequence of each of `tables`."""
+    next_id = (
+        "COALESCE(pg_sequence_last_value(pg_get_serial_sequence(%s, 'id')::regclass), 0)"
+        " + 1"
+    )
+    cursor.execute("SELECT %s" % ", ".join([next_id] * len(tables)), tables)
+    return cursor.fetchone()
+
+
+def ensure_partitions(used=None, writers=1, size=settings.MEX_PARTITION_SIZE):
+    """Make sure the next `size` ids of every partitioned table have a partition.
+
+    `used` maps models to the number of ids this process used since the last
+    call. The id sequences are only read again once the process used up its
+    share of the spare ids of a table among `writers` concurrent writers.
+    Without `used` the sequences are always read.
+    """
+    if not size or connection.vendor != "postgresql":
+        return
+
+    if used is not None and _budget:
+        for model, count in used.items():
+            if model._meta.db_table in _budget:
+                _budget[model._meta.db_table] -= count
+        if all(left > 0 for left in _budget.values()):
+            return
+
+    global _limits
+    with connection.cursor() as cursor:
+        if _limits is None:
+            _limits = {
+                model._meta.db_table: partition_limit(cursor, model._meta.db_table)
+                for model in PARTITIONED_MODELS
+                if is_partitioned(cursor, model._meta.db_table)
+            }
+        if not _limits:
+            return
+
+        tables = sorted(_limits)
+        next_ids = _next_ids(cursor, tables)
+        if any(next_id + size > _limits[t] for t, next_id in zip(tables, next_ids)):
+            with transaction.atomic():
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [PARTITION_LOCK])
+                for model in LOCKED_MODELS:
+                    table = model._meta.db_table
+                    mode = (
+                        "ACCESS EXCLUSIVE"
+                        if table in _limits
+                        else "SHARE ROW EXCLUSIVE"
+                    )
+                    cursor.execute(
+                        "LOCK TABLE %s IN %s MODE"
+                        % (connection.ops.quote_name(table), mode)
+                    )
+                for table, next_id in zip(tables, next_ids):
+                    _limits[table] = create_partitions(
+                        cursor, table, size, next_id + size
+                    )
+
+    # at least `size` ids are spare now. Keeping half of them in reserve leaves
+    # room for the ids of the blocks the other writers import in the meantime.
+    for table, next_id in zip(tables, next_ids):
+        _budget[table] = (_limits[table] - next_id - size // 2) // writers
+
+
+def partition_tables(size=settings.MEX_PARTITION_SIZE):
+    """Convert the tables of `PARTITIONED_MODELS` to partitioned tables.
+
+    Existing rows are copied into the new partitions. Indexes and foreign keys
+    from and to the tables are recreated under their original names.
+    """
+    global _limits
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model in PARTITIONED_MODELS:
+            table = model._meta.db_table
+            if is_partitioned(cursor, table):
+                log.info("%s is already partitioned" % table)
+                continue
+            _partition_table(cursor, table, size)
+    _limits = None
+    _budget.clear()
+
+
+def _partition_table(cursor, table, size):
+    quote = connection.ops.quote_name
+    old = "%s_unpartitioned" % table
+
+    # foreign keys from and to the table before its primary key
+    cursor.execute(
+        "SELECT conname, conrelid::regclass::text, pg_get_constraintdef(oid) "
+        "FROM pg_constraint WHERE contype IN ('p', 'f') AND conparentid = 0 "
+        "AND (conrelid = %s::regclass OR confrelid = %s::regclass) "
+        "ORDER BY contype",
+        [table, table],
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN "
+        "(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)",
+        [table, table],
+    )
+    indexes = [indexdef for indexdef, in cursor.fetchall()]
+
+    for name, relation, _ in constraints:
+        cursor.execute("ALTER TABLE %s DROP CONSTRAINT %s" % (relation, quote(name)))
+    cursor.execute("ALTER TABLE %s RENAME TO %s" % (quote(table), quote(old)))
+    for indexdef in indexes:
+        name = indexdef.split()[2]
+        cursor.execute("DROP INDEX %s" % name)
+
+    cursor.execute(
+        "CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        "PARTITION BY RANGE (id)" % (quote(table), quote(old))
+    )
+    cursor.execute("SELECT max(id) FROM %s" % quote(old))
+    max_id = cursor.fetchone()[0] or 0
+    create_partitions(cursor, table, size, max_id + size)
+    cursor.execute("INSERT INTO %s SELECT * FROM %s" % (quote(table), quote(old)))
+    log.info("copied %s rows into partitioned %s" % (cursor.rowcount, table))
+
+    for indexdef in indexes:
+        cursor.execute(indexdef)
+    # the primary key comes first as foreign keys reference it
+    for name, relation, definition in reversed(constraints):
+        cursor.execute(
+            "ALTER TABLE %s ADD CONSTRAINT %s %s" % (relation, quote(name), definition)
+        )
+
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [old])
+    sequence = cursor.fetchone()[0]
+    cursor.execute("ALTER SEQUENCE %s OWNED BY %s.id" % (sequence, quote(table)))
+    cursor.execute("DROP TABLE %s" % quote(old))
@@ -1,12 +1,23 @@
 # -*- coding: utf-8 -*-
 from django.db import models
-from django.db.models import Sum, Q
+from django.db.models import F, Subquery
+from django.db.models.functions import Coalesce
 
 
 class AddressQuerySet(models.QuerySet):
     def with_balance(self):
-        return self.annotate(
-            balance=Sum(
-                "outputs_for_addr__value", filter=Q(outputs_for_addr__spent=False)
-            )
-        )
+        """Annotate the balance maintained in `AddressBalance`, 0 if it has none.
+
+        Meant for single addresses and the admin. Lists ordered by balance should
+        query `AddressBalance`, whose index covers that ordering.
+        """
+        return self.annotate(balance=Coalesce(F("addressbalance__balance"), 0))
+
+
+class PermissionQuerySet(models.QuerySet):
+    def active(self):
+        """Filter permissions that are valid at the indexed tip height."""
+        from mex.models import Block
+
+        tip = Subquery(Block.objects.order_by("-height").values("height")[:1])
+        return self.filter(startblock__lt=tip, endblock__gt=tip)
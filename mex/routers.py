@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Read replica routing for the web frontend.
+
+With database aliases listed in `MEX_DB_REPLICAS` the `ReplicaMiddleware`
+serves the mex models of GET and HEAD requests from a replica. Writes, the
+sync process and all other apps stay on the default database. A replica is
+only used if it has caught up with the tip height the visitor has already
+seen, which is remembered in a cookie.
+"""
+
+import contextvars
+import logging
+import random
+import time
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+
+
+log = logging.getLogger(__name__)
+
+
+TIP_COOKIE = "mex_tip"
+
+# seconds a measured tip height is reused
+TIP_HEIGHT_TTL = 2
+
+# replica alias selected for the current request
+_replica = contextvars.ContextVar("mex_replica", default=None)
+
+# alias -> (tip height, time measured)
+_tip_heights = {}
+
+
+def tip_height(alias):
+    """Return the newest block height in database `alias` or None if unavailable."""
+    now = time.monotonic()
+    cached = _tip_heights.get(alias)
+    if cached is not None and now - cached[1] < TIP_HEIGHT_TTL:
+        return cached[0]
+
+    from mex.models import Block
+
+    try:
+        height = (
+            Block.objects.using(alias)
+            .order_by("-height")
+            .values_list("height", flat=True)
+            .first()
+        )
+    except DatabaseError as e:
+        log.warning("database %s is unavailable: %r" % (alias, e))
+        height = None
+    else:
+        height = -1 if height is None else height
+    _tip_heights[alias] = (height, now)
+    return height
+
+
+class ReplicaRouter:
+    """Route reads of mex models to the replica selected for the request."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == "mex":
+            return _replica.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.MEX_DB_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.MEX_DB_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """Serve read-only requests from a replica that is not behind the visitor.
+
+    Requests for objects the replica does not have yet (404) are retried on
+    the default database.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.MEX_DB_REPLICAS or request.method not in ("GET", "HEAD"):
+            return self.get_response(request)
+
+        try:
+            seen = int(request.COOKIES.get(TIP_COOKIE, -1))
+        except ValueError:
+            seen = -1
+
+        replicas = []
+        for alias in settings.MEX_DB_REPLICAS:
+            height = tip_height(alias)
+            if height is not None and height >= seen:
+                replicas.append((alias, height))
+
+        if replicas:
+            alias, height = random.choice(replicas)
+            token = _replica.set(alias)
+            try:
+                response = self.get_response(request)
+            finally:
+                _replica.reset(token)
+            if response.status_code != 404:
+                return self._remember(response, seen, height)
+
+        response = self.get_response(request)
+        return self._remember(response, seen, tip_height(DEFAULT_DB_ALIAS))
+
+    def _remember(self, response, seen, height):
+        if height is not None and height > seen:
+            response.set_cookie(TIP_COOKIE, height)
+        return response
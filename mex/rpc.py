@@ -1,12 +1,297 @@
 # -*- coding: utf-8 -*-
+"""JSON-RPC client for the node.
+
+All clients returned by `get_client` send their calls through one
+process-wide `requests.Session`. It keeps up to `MEX_RPC_POOL_SIZE`
+connections to the node alive and is safe to share between threads.
+Failed connections are retried `MEX_RPC_RETRIES` times with exponential
+backoff, calls that time out are not sent again. Results of slowly changing
+methods are kept in the Django cache `MEX_RPC_CACHE` (see `BatchRpcClient`).
+Identical requests sent at the same time share one response (see
+`BatchRpcClient._coalesce`).
+"""
+
+import hashlib
 import logging
+import math
+import os
+import threading
+import time
+from decimal import Decimal
+import requests
+import simplejson as json
 from django.conf import settings
+from django.core.cache import caches
 from mcrpc import RpcClient
+from mcrpc.exceptions import RpcError
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+
 
 log = logging.getLogger(__name__)
 
+# cache.get default that tells a cached None from a cache miss
+MISSING = object()
+
+# seconds a response shared between processes stays in the cache
+COALESCE_CONTENT_TTL = 2
+
+# seconds between checks for the response of another process
+COALESCE_POLL_INTERVAL = 0.02
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class NodeRetry(Retry):
+    """Retry that does not resend calls the node did not answer in time.
+
+    A call that timed out most likely still runs on a busy node, sending it
+    again only adds load.
+    """
+
+    def increment(self, method=None, url=None, *args, error=None, **kwargs):
+        if isinstance(error, ReadTimeoutError):
+            raise error
+        return super().increment(method, url, *args, error=error, **kwargs)
+
+
+def get_session():
+    """Return the keep-alive session shared by all RPC clients of the process."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = NodeRetry(
+                    total=settings.MEX_RPC_RETRIES,
+                    # one read retry resends a call on a kept alive connection
+                    # that the node closed, POST requests included
+                    read=1,
+                    allowed_methods=None,
+                    backoff_factor=settings.MEX_RPC_BACKOFF,
+                    status_forcelist=(502, 503, 504),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.MEX_RPC_POOL_SIZE,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def max_request_time():
+    """Return the seconds a node request can take including all its retries."""
+    tries = settings.MEX_RPC_RETRIES + 1
+    timeouts = (settings.MEX_RPC_CONNECT_TIMEOUT + settings.MEX_RPC_TIMEOUT) * tries
+    backoff = sum(settings.MEX_RPC_BACKOFF * 2**n for n in range(tries))
+    return math.ceil(timeouts + backoff)
+
+
+class Flight:
+    """Node request in progress that identical requests wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.content = None
+        self.error = None
+
+
+# request digest -> Flight of the requests in progress in this process
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # connections and requests inherited by forked sync workers belong to the parent
+    global _session, _session_lock, _flights, _flights_lock
+    _session = None
+    _session_lock = threading.Lock()
+    _flights = {}
+    _flights_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class BatchRpcClient(RpcClient):
+    """RpcClient that can send multiple calls in one JSON-RPC batch request.
+
+    Results of the methods in `MEX_RPC_CACHE_TTL` are cached. Methods with a
+    TTL of None never change their results and are cached forever. All other
+    results are cached for their TTL in seconds but only until the node's
+    best block changes.
+    """
+
+    def _post(self, payload):
+        serialized = json.dumps(payload, use_decimal=True)
+        if settings.MEX_RPC_COALESCE:
+            content = self._coalesce(serialized)
+        else:
+            content = self._send(serialized)
+        # every caller parses its own copy of a shared response
+        return json.loads(content, parse_float=Decimal)
+
+    def _send(self, serialized):
+        response = get_session().post(
+            self._url,
+            data=serialized,
+            verify=False,
+            timeout=(settings.MEX_RPC_CONNECT_TIMEOUT, settings.MEX_RPC_TIMEOUT),
+        )
+        return response.content
+
+    def _coalesce(self, serialized):
+        """Wait for an identical request in progress or send it and share its response.
+
+        With `MEX_RPC_COALESCE_CACHE` requests are also shared between processes.
+        """
+        key = hashlib.md5((self._url + serialized).encode()).hexdigest()
+        with _flights_lock:
+            flight = _flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _flights[key] = Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.content
+
+        try:
+            if settings.MEX_RPC_COALESCE_CACHE:
+                flight.content = self._send_shared(key, serialized)
+            else:
+                flight.content = self._send(serialized)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with _flights_lock:
+                del _flights[key]
+            flight.done.set()
+        return flight.content
+
+    def _send_shared(self, key, serialized):
+        """Send the request unless another process holds its lock in the cache."""
+        cache = caches[settings.MEX_RPC_COALESCE_CACHE]
+        lock_key, content_key = "mex:rpc:lock:" + key, "mex:rpc:content:" + key
+        # the lock must outlive the request of its holder, retries included
+        timeout = max_request_time()
+        if cache.add(lock_key, True, timeout):
+            try:
+                content = self._send(serialized)
+                cache.set(content_key, content, COALESCE_CONTENT_TTL)
+            finally:
+                cache.delete(lock_key)
+            return content
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            content = cache.get(content_key)
+            if content is not None:
+                return content
+            if not cache.get(lock_key):
+                break
+            time.sleep(COALESCE_POLL_INTERVAL)
+        # the other process failed or took too long
+        return self._send(serialized)
+
+    def _call(self, method, *args):
+        args = [arg for arg in args if arg is not None]
+        if method not in settings.MEX_RPC_CACHE_TTL:
+            return self._fetch(method, args)
+        cache = caches[settings.MEX_RPC_CACHE]
+        key = self._cache_key(method, args)
+        result = cache.get(key, MISSING)
+        if result is MISSING:
+            result = self._fetch(method, args)
+            cache.set(key, result, settings.MEX_RPC_CACHE_TTL[method])
+        return result
+
+    def _fetch(self, method, args):
+        data = self._post({"method": method, "params": args})
+        if data["error"] is not None:
+            raise RpcError(data["error"].get("message"))
+        return data["result"]
+
+    def _cache_key(self, method, args):
+        tip = "" if settings.MEX_RPC_CACHE_TTL[method] is None else self.tip()
+        call = json.dumps([self.host, self.port, method, args], use_decimal=True)
+        digest = hashlib.md5(call.encode()).hexdigest()
+        return "mex:rpc:%s:%s:%s" % (method, tip, digest)
+
+    def tip(self):
+        """Return the best block hash, cached for `MEX_RPC_TIP_TTL` seconds."""
+        cache = caches[settings.MEX_RPC_CACHE]
+        key = "mex:rpc:tip:%s:%s" % (self.host, self.port)
+        tip = cache.get(key)
+        if tip is None:
+            tip = self._fetch("getbestblockhash", [])
+            cache.set(key, tip, settings.MEX_RPC_TIP_TTL)
+        return tip
+
+    def batch(self, calls):
+        """Send `calls` in a single HTTP request and return their results in order.
+
+        `calls` is a sequence of (method, *params) tuples. Raises RpcError if
+        any of the calls fails. Cached results are not requested again.
+
+        api.batch([("getblockcount",), ("listpermissions", "mine")])
+        [59354, [{'address': ...}]]
+        """
+        calls = [
+            (method, [arg for arg in args if arg is not None])
+            for method, *args in calls
+        ]
+        keys = {
+            call_id: self._cache_key(method, args)
+            for call_id, (method, args) in enumerate(calls)
+            if method in settings.MEX_RPC_CACHE_TTL
+        }
+        cache = caches[settings.MEX_RPC_CACHE]
+        cached = cache.get_many(keys.values()) if keys else {}
+        results = [
+            cached.get(keys.get(call_id), MISSING) for call_id in range(len(calls))
+        ]
+
+        missing = [
+            call_id for call_id, result in enumerate(results) if result is MISSING
+        ]
+        fetched = self._fetch_batch([calls[call_id] for call_id in missing])
+        for call_id, result in zip(missing, fetched):
+            results[call_id] = result
+            if call_id in keys:
+                ttl = settings.MEX_RPC_CACHE_TTL[calls[call_id][0]]
+                cache.set(keys[call_id], result, ttl)
+        return results
+
+    def _fetch_batch(self, calls):
+        if not calls:
+            return []
+        payload = [
+            {"id": call_id, "method": method, "params": args}
+            for call_id, (method, args) in enumerate(calls)
+        ]
+        data = self._post(payload)
+        if isinstance(data, dict):
+            # node rejected the batch as a whole
+            raise RpcError((data.get("error") or {}).get("message"))
+        results = [None] * len(calls)
+        for item in data:
+            if item["error"] is not None:
+                raise RpcError(item["error"].get("message"))
+            results[item["id"]] = item["result"]
+        return results
+
 
 def get_client():
-    return RpcClient(
+    return BatchRpcClient(
         settings.NODE_IP, settings.NODE_PORT, settings.NODE_USER, settings.NODE_PWD
     )
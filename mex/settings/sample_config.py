@@ -12,9 +12,29 @@ DATABASES = {
         "PASSWORD": "postgres",
         "HOST": "127.0.0.1",
         "PORT": "5432",
-    }
+    },
+    # "replica": {
+    #     "ENGINE": "django.db.backends.postgresql",
+    #     "NAME": "mex",
+    #     "USER": "postgres",
+    #     "PASSWORD": "postgres",
+    #     "HOST": "10.0.0.2",
+    #     "PORT": "5432",
+    # },
 }
 
+# transactions are always keyed by a 64-bit integer id with a unique hash index
+# (migration 0007 converts existing databases). There is no setting to keep the
+# former hash keyed schema.
+
+# cache shared by all web workers, e.g. for node results
+# CACHES = {
+#     "default": {
+#         "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+#         "LOCATION": "/var/tmp/mex_cache",
+#     }
+# }
+
 
 MEX_BRAND = "COBLO Explorer"
 MEX_FEATURED_STREAM = "iscc"
@@ -25,7 +45,50 @@ MEX_SYMBOL = "CBL"
 MEX_CURRENCY = "CoBlo"
 MEX_FOOTER = "Copyright 2017-2020 <a style='color:white;' href='https://content-blockchain.org'>The Content Blockchain Project</a>"
 MEX_IGNORE_STREAMS = ["root"]
-MEX_SYNC_HORIZON = 300
+# streams listed on the streams page with a fallback description. The sync
+# process indexes their items.
+MEX_STREAMS = {
+    "alias": "Address alias registrations",
+    "DOI": "Open Stream that maps DOI to ISCC",
+    "ISBN": "Open Stream that maps ISBN to ISCC",
+    "iscc": "Public ISCC Registry",
+    "smart-license": "Public Smart License Registry",
+    "test": "Stream for test data",
+    "timestamp": "Open timestamping with SHA-256",
+}
+MEX_SYNC_PREFETCH_DEPTH = 32
+MEX_SYNC_PREFETCH_WORKERS = 4
+MEX_SYNC_RPC_BATCH_SIZE = 8
+MEX_SYNC_UTXO_CACHE_SIZE = 1000000
+MEX_SYNC_ADDRESS_CACHE_SIZE = 100000
+MEX_SYNC_PARALLEL_CHUNK = 1000
+MEX_SYNC_LOADER = "orm"
+MEX_SYNC_INTERVAL = 10
+MEX_SYNC_NOTIFY_HOST = "127.0.0.1"
+MEX_SYNC_NOTIFY_PORT = None
+MEX_PARTITION_SIZE = None
+MEX_DB_REPLICAS = []  # e.g. ["replica"]
+MEX_RPC_POOL_SIZE = 8  # keep below the -rpcthreads of the node
+MEX_RPC_CONNECT_TIMEOUT = 5
+MEX_RPC_TIMEOUT = 60
+MEX_RPC_RETRIES = 3
+MEX_RPC_BACKOFF = 0.2
+MEX_RPC_CACHE = "default"
+# seconds results are cached until the next block, None caches them forever
+MEX_RPC_CACHE_TTL = {
+    "getblockchainparams": None,
+    "getinfo": 10,
+    "liststreams": 10,
+    "listassets": 60,
+}
+MEX_RPC_TIP_TTL = 2
+MEX_RPC_COALESCE = True
+MEX_RPC_COALESCE_CACHE = None  # e.g. "default" to also coalesce between processes
+MEX_STREAM_WINDOW_CACHE_SIZE = 256
+MEX_STREAM_READ_AHEAD = True
+MEX_PAGE_CACHE = "default"
+MEX_PAGE_CACHE_TTL = 300
+MEX_PAGE_TIP_TTL = 5
 
 NODE_IP = "127.0.0.1"
 NODE_PORT = "8374"
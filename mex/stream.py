@@ -1,86 +1,129 @@
 # -*- coding: utf-8 -*-
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.utils.functional import cached_property
 from django_tables2.data import TableData
 from mex.rpc import get_client
 from mcrpc.exceptions import RpcError
 
 
+log = logging.getLogger(__name__)
+
+
+class StreamWindows:
+    """Bounded LRU cache of windows of stream items read from the node.
+
+    Windows are keyed by (stream, item count, start, count) with `start` as
+    ascending offset. Items are only ever appended to a stream, so a window
+    stays valid as long as the stream has the same item count.
+    """
+
+    def __init__(self, max_size=settings.MEX_STREAM_WINDOW_CACHE_SIZE):
+        self.max_size = max_size
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def __len__(self):
+        return len(self._windows)
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+
+    def get(self, name, items, start, count):
+        """Return `count` items of stream `name` from ascending offset `start`."""
+        key = (name, items, start, count)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None:
+                self._windows.move_to_end(key)
+                return window
+
+        window = get_client().liststreamitems(
+            name, verbose=True, count=count, start=start, local_ordering=False
+        )
+        with self._lock:
+            self._windows[key] = window
+            while len(self._windows) > self.max_size:
+                self._windows.popitem(last=False)
+        return window
+
+    def read_ahead(self, name, items, start, count):
+        """Load a window in the background unless it is cached already."""
+        if count <= 0 or (name, items, start, count) in self._windows:
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+        self._executor.submit(self._read_ahead, name, items, start, count)
+
+    def _read_ahead(self, name, items, start, count):
+        try:
+            self.get(name, items, start, count)
+        except Exception as e:
+            log.debug("read-ahead of stream %s failed: %r" % (name, e))
+
+
+windows = StreamWindows()
+
+
 class LazyStream:
-    """A 'paginatable' wrapper for MultiChain Streams"""
+    """A 'paginatable' wrapper for MultiChain Streams
+
+    The item count is read once per instance and items are served from the
+    shared `windows` cache.
+    """
 
     def __init__(self, name, descending=True):
         self.name = name
         self.descending = descending
         self.api = get_client()
 
-    def __len__(self):
+    @cached_property
+    def items(self):
         try:
             return int(self.api.liststreams(self.name)[0]["items"])
         except (RpcError, IndexError):
             return 0
 
-    def __getitem__(self, item):
-        if self.descending:
-            return self._get_descending(item)
-        else:
-            return self._get_ascending(item)
+    def __len__(self):
+        return self.items
 
-    def _get_ascending(self, item):
-        """From oldest to latest"""
-        if isinstance(item, slice):
-            count = item.stop - item.start
-            try:
-                result = self.api.liststreamitems(
-                    self.name,
-                    verbose=True,
-                    count=count,
-                    start=item.start,
-                    local_ordering=False,
-                )
-                result = [dict(e, stream=self.name) for e in result]
-            except RpcError:
-                return []
-            return result
-
-        elif isinstance(item, int):
-            try:
-                result = self.api.liststreamitems(
-                    self.name, verbose=True, count=1, start=item, local_ordering=False
-                )[0]
-                result["stream"] = self.name
-            except (RpcError, IndexError):
-                return {}
-            return result
-
-    def _get_descending(self, item):
-        """From latest to oldest entry"""
+    def __getitem__(self, item):
         if isinstance(item, slice):
-            count = item.stop - item.start
-            try:
-                result = self.api.liststreamitems(
-                    self.name,
-                    verbose=True,
-                    count=count,
-                    start=-(item.start + count),
-                    local_ordering=False,
-                )
-                result = [dict(e, stream=self.name) for e in result]
-            except RpcError:
-                return []
-            return list(reversed(result))
-
-        elif isinstance(item, int):
-            try:
-                result = self.api.liststreamitems(
-                    self.name,
-                    verbose=True,
-                    count=1,
-                    start=-(item + 1),
-                    local_ordering=False,
-                )[0]
-                result["stream"] = self.name
-            except (RpcError, IndexError):
-                return {}
-            return result
+            return self._get_slice(item.start or 0, item.stop)
+        try:
+            return self._get_slice(item, item + 1)[0]
+        except IndexError:
+            return {}
+
+    def _get_slice(self, first, stop):
+        """Items `first` to `stop` in the current sort order."""
+        start, count = self._window(first, stop)
+        if count <= 0:
+            return []
+        try:
+            result = windows.get(self.name, self.items, start, count)
+        except RpcError:
+            return []
+        if settings.MEX_STREAM_READ_AHEAD:
+            next_start, next_count = self._window(first + count, first + 2 * count)
+            windows.read_ahead(self.name, self.items, next_start, next_count)
+        result = [dict(e, stream=self.name) for e in result]
+        return list(reversed(result)) if self.descending else result
+
+    def _window(self, first, stop):
+        """Ascending offset and count of the items `first` to `stop`."""
+        stop = min(stop, self.items)
+        if self.descending:
+            # from latest to oldest entry
+            return self.items - stop, stop - first
+        # from oldest to latest
+        return first, stop - first
 
 
 class TableDataLen(TableData):
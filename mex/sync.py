@@ -1,65 +1,122 @@
 # -*- coding: utf-8 -*-
+import multiprocessing
+from collections import Counter
 from datetime import datetime
+from itertools import chain
 import pytz
 from django.conf import settings
 from django.db import InterfaceError, OperationalError
-from django.db import connection
+from django.db import connection, connections, transaction
+from django.db.models import Count, F, Max, Min
+from mex.activity import ACTIVITY_FIELDS, activity_rows
+from mex.addresses import AddressRegistry
+from mex.balances import rollback_balances, tally, update_balances
+from mcrpc.exceptions import RpcError
 from mex.exceptions import SyncError
+from mex.loader import get_loader, link_spends, link_pending_spends
+from mex.pagecache import invalidate_pages
+from mex.partitions import ensure_partitions
 from mex.rpc import get_client
-from mex.models import Block, Transaction, Output, Address, Input
+from mex.models import (
+    AddressActivity,
+    AddressBalance,
+    Block,
+    Transaction,
+    Output,
+    Input,
+    PendingSpend,
+    Permission,
+    Stream,
+    StreamItem,
+    SyncState,
+)
 import logging
-from mex.tools import batchwise
+from mex.tools import batchwise, chunked, prefetch
+from mex.utxo import UtxoIndex
 
 
 log = logging.getLogger("mex.sync")
 
+utxos = UtxoIndex()
+addresses = AddressRegistry()
 
-def clean_reorgs(horizon=settings.MEX_SYNC_HORIZON):
-    """
-    Clean chain reorganizations up to `horizon` number of blocks in the past.
 
-    First we compare the latest `horizon` block hashes from the database with
-    those form the authoritative node. If we find a difference we will delete
-    all the blocks starting at the oldest differing block. Deleteing those
-    blocks will automatically cascade throuth the datamodel and delete all
-    dependant transactions, inputs and outputs.
+def clean_reorgs():
+    """
+    Clean chain reorganizations.
+
+    First we compare the hash of the latest block in the database with the
+    block at the same height on the authoritative node. Only if they differ we
+    walk back along the stored `previousblockhash` links until we find the
+    newest block the node agrees with and delete all blocks after it. Where a
+    link is missing the stored hash of the block below is compared instead and
+    missing heights count as orphaned. Deleting those blocks will automatically
+    cascade through the datamodel and delete all dependant transactions, inputs
+    and outputs.
     """
-    log.info("clean reorgs with horizon {}".format(horizon))
+    log.info("clean reorgs")
     api = get_client()
 
-    node_height = api.getblockcount()
-    db_height = Block.get_db_height()
-    if db_height > node_height:
-        log.warning("database is ahead of node")
-        return
-
-    db_blocks = list(
-        Block.objects.order_by("-height").values_list("height", "hash")[:horizon]
+    tip = (
+        Block.objects.order_by("-height")
+        .values_list("height", "hash", "previousblockhash")
+        .first()
     )
-    if not db_blocks:
+    if tip is None:
         log.info("database has no block data")
         return
 
-    db_height = db_blocks[0][0]
-    db_horizon = db_blocks[-1][0]
-
-    horizon_range = "%s-%s" % (db_horizon, db_height)
-    node_data = api.listblocks(horizon_range, False)
-    node_blocks = [(b["height"], b["hash"]) for b in reversed(node_data)]
-    difference = set(db_blocks).difference(set(node_blocks))
+    db_height, db_hash, parent_hash = tip
+    try:
+        node_hash = api.getblockhash(db_height)
+    except RpcError:
+        log.warning("database is ahead of node")
+        return
 
-    if not difference:
+    if node_hash == db_hash:
         log.info("no reorgs found")
         return
 
-    fork_height = min(difference)[0]
+    fork_height = db_height
+    while fork_height > 0:
+        if parent_hash is None:
+            # no stored link, compare the block below instead if there is one
+            parent_hash = (
+                Block.objects.values_list("hash", flat=True)
+                .filter(height=fork_height - 1)
+                .first()
+            )
+        if parent_hash is not None:
+            if api.getblockhash(fork_height - 1) == str(parent_hash):
+                break
+        fork_height -= 1
+        parent_hash = (
+            Block.objects.values_list("previousblockhash", flat=True)
+            .filter(height=fork_height)
+            .first()
+        )
+
     log.info("database reorg from height %s" % fork_height)
-    Block.objects.filter(height__gte=fork_height).delete()
+    orphaned_items = (
+        StreamItem.objects.filter(block__gte=fork_height)
+        .values_list("stream")
+        .annotate(Count("id"))
+        .order_by()
+    )
+    with transaction.atomic():
+        rollback_balances(fork_height)
+        for stream, count in orphaned_items:
+            Stream.objects.filter(name=stream).update(items=F("items") - count)
+        Block.objects.filter(height__gte=fork_height).delete()
+        SyncState.objects.filter(height__gte=fork_height).update(height=fork_height - 1)
+    utxos.clear()
+    invalidate_pages()
 
 
 def sync_blocks(batch_size=1000):
 
     api = get_client()
+    loader = get_loader()
     db_height = Block.get_db_height()
     node_height = api.getblockcount()
 
@@ -72,156 +129,463 @@ def sync_blocks(batch_size=1000):
 
     log.info("sync blocks %s-%s" % (db_height + 1, node_height))
 
-    block_counter = 0
+    prev_hash = (
+        Block.objects.values_list("hash", flat=True).filter(height=db_height).first()
+    )
 
-    existing_addrs = set(Address.objects.values_list("address", flat=True))
+    block_counter = 0
+    reorged = False
+
+    block_fields = (
+        "height",
+        "hash",
+        "merkleroot",
+        "miner_id",
+        "time",
+        "txcount",
+        "size",
+        "previousblockhash",
+    )
 
     from_to = range(db_height + 1, node_height)
     for batch in batchwise(from_to, batch_size=batch_size):
         log.info("sync blocks batch %s" % batch)
-        block_objs = []
+        block_rows = []
         for block_data in api.listblocks(batch, True):
 
-            miner_addr = block_data["miner"]
-            if miner_addr not in existing_addrs:
-                Address.objects.create(address=miner_addr)
-                existing_addrs.add(miner_addr)
+            if block_data.get("previousblockhash") != prev_hash:
+                # chain changed since clean_reorgs, the next round cleans up
+                log.warning("reorg at height %s during sync" % block_data["height"])
+                reorged = True
+                break
+            prev_hash = block_data["hash"]
 
+            miner_addr = block_data["miner"]
             blocktime = datetime.fromtimestamp(block_data["time"], tz=pytz.utc)
 
-            block_objs.append(
-                Block(
-                    height=block_data["height"],
-                    hash=block_data["hash"],
-                    merkleroot=block_data["merkleroot"],
-                    miner_id=miner_addr,
-                    time=blocktime,
-                    txcount=block_data["txcount"],
-                    size=block_data["size"],
+            block_rows.append(
+                (
+                    block_data["height"],
+                    block_data["hash"],
+                    block_data["merkleroot"],
+                    miner_addr,
+                    blocktime,
+                    block_data["txcount"],
+                    block_data["size"],
+                    block_data.get("previousblockhash"),
                 )
             )
             block_counter += 1
 
-        Block.objects.bulk_create(block_objs, batch_size=batch_size)
+        miners = sorted({row[3] for row in block_rows if row[3]})
+        addresses.ensure(miners)
+        AddressBalance.objects.bulk_create(
+            [AddressBalance(address_id=miner) for miner in miners],
+            ignore_conflicts=True,
+        )
+        loader.insert(Block, block_fields, block_rows)
+        invalidate_pages()
+        if reorged:
+            break
 
     log.info("imported %s blocks" % block_counter)
 
 
-def sync_transactions():
+def indexed_streams():
+    """Names of the streams whose items are indexed in the database."""
+    names = {settings.MEX_FEATURED_STREAM} | set(settings.MEX_STREAMS)
+    return names - set(settings.MEX_IGNORE_STREAMS)
+
+
+def sync_streams(batch_size=1000):
+    """Index the confirmed items of all subscribed `indexed_streams`."""
     api = get_client()
-    queryset = (
-        Block.objects.filter(transactions__isnull=True).only("hash").order_by("height")
-    )
+    names = indexed_streams()
+    for info in api.liststreams("*", True):
+        if info["name"] not in names:
+            continue
+        if not info.get("subscribed", True):
+            log.warning("node is not subscribed to stream %s" % info["name"])
+            continue
+        stream, _ = Stream.objects.update_or_create(
+            name=info["name"],
+            defaults=dict(
+                createtxid=info.get("createtxid"),
+                details=info.get("details") or {},
+                restrict=info.get("restrict") or {},
+                creators=info.get("creators") or [],
+            ),
+        )
+        try:
+            sync_stream_items(stream, batch_size)
+        except RpcError as e:
+            log.warning("cannot index stream %s: %s" % (stream.name, e))
+
+
+def sync_stream_items(stream, batch_size=1000):
+    """
+    Index the items of `stream` that follow the already indexed ones.
+
+    The node lists confirmed items in chain order followed by unconfirmed ones,
+    so `Stream.items` is the offset of the next item to index. Items are only
+    indexed once their block is in the database.
+    """
+    api = get_client()
+    while True:
+        items = api.liststreamitems(
+            stream.name,
+            verbose=True,
+            count=batch_size,
+            start=stream.items,
+            local_ordering=False,
+        )
+        block_hashes = {item["blockhash"] for item in items if item.get("blockhash")}
+        heights = dict(
+            Block.objects.filter(hash__in=block_hashes).values_list("hash", "height")
+        )
+
+        rows = []
+        for item in items:
+            height = heights.get(item.get("blockhash"))
+            if height is None:
+                break
+            rows.append(
+                StreamItem(
+                    stream=stream,
+                    block_id=height,
+                    txid=item["txid"],
+                    vout=item["vout"],
+                    keys=item["keys"] if "keys" in item else [item["key"]],
+                    publishers=item["publishers"],
+                    data=item["data"],
+                    offchain=item.get("offchain", False),
+                    time=datetime.fromtimestamp(item["blocktime"], tz=pytz.utc),
+                )
+            )
+
+        if rows:
+            with transaction.atomic():
+                StreamItem.objects.bulk_create(rows, ignore_conflicts=True)
+                Stream.objects.filter(name=stream.name).update(
+                    items=F("items") + len(rows)
+                )
+            stream.items += len(rows)
+            log.info("indexed %s items of stream %s" % (len(rows), stream.name))
+
+        if len(rows) < batch_size:
+            return
+
+
+def sync_permissions():
+    """Replace the indexed permissions if those of the node changed."""
+    api = get_client()
+    listed = {
+        (perm["address"], perm["type"], perm["startblock"], perm["endblock"])
+        for perm in api.listpermissions("%s,%s" % (Permission.MINE, Permission.ADMIN))
+    }
+    fields = ("address", "type", "startblock", "endblock")
+    if listed == set(Permission.objects.values_list(*fields)):
+        return
+    with transaction.atomic():
+        Permission.objects.all().delete()
+        Permission.objects.bulk_create(
+            [Permission(**dict(zip(fields, row))) for row in listed]
+        )
+    log.info("indexed %s permissions" % len(listed))
+
+
+def sync_transactions(
+    depth=settings.MEX_SYNC_PREFETCH_DEPTH,
+    workers=settings.MEX_SYNC_PREFETCH_WORKERS,
+    batch_size=settings.MEX_SYNC_RPC_BATCH_SIZE,
+    start=None,
+    stop=None,
+    deferred=False,
+    writers=1,
+):
+    """
+    Import transactions, outputs and inputs for all blocks not yet ingested.
+
+    Blocks are fetched from the node in JSON-RPC batches of `batch_size` calls
+    by a pool of `workers` threads that stay up to `depth` blocks ahead of the
+    database writer. The writer ingests the prefetched blocks strictly in
+    height order. Each block is ingested in its own database transaction
+    together with its `Block.ingested` flag and the "transactions" sync
+    cursor, so an interrupted sync resumes with the first incomplete block.
+
+    Optionally only blocks with heights from `start` to `stop` (inclusive) are
+    imported. With `deferred=True` inputs spending outputs that are unknown to
+    the utxo index are recorded as `PendingSpend` to be linked later by
+    `link_pending_spends` instead of being linked right away. `writers` is the
+    number of processes that import blocks concurrently.
+    """
+    queryset = Block.objects.filter(ingested=False).only("hash").order_by("height")
+    if start is not None:
+        queryset = queryset.filter(height__gte=start)
+    if stop is not None:
+        queryset = queryset.filter(height__lte=stop)
     if not queryset.exists():
         return
-    addrs_existing = set(Address.objects.values_list("address", flat=True))
+
+    api = get_client()
+    loader = get_loader()
     log.info("sync transactions from %s blocks" % queryset.count())
-    tx_counter = 0
-    out_counter = 0
-    in_counter = 0
-    addr_counter = 0
+    counts = Counter()
+
+    def fetch(block_objs):
+        calls = [("getblock", str(block_obj.hash), 4) for block_obj in block_objs]
+        return zip(block_objs, api.batch(calls))
+
+    batch_size = max(batch_size, 1)
+    batches = prefetch(
+        fetch, chunked(queryset, batch_size), max(depth // batch_size, 1), workers
+    )
+    ensure_partitions(writers=writers)
+    block_counts = Counter()
+    for block_obj, block_data in chain.from_iterable(batches):
+        ensure_partitions(
+            {Output: block_counts["outputs"], Input: block_counts["inputs"]}, writers
+        )
+        try:
+            with transaction.atomic():
+                block_counts = ingest_block(
+                    block_obj.height, block_data, loader, deferred
+                )
+                Block.objects.filter(height=block_obj.height).update(ingested=True)
+                SyncState.advance("transactions", block_obj.height)
+        except Exception:
+            # caches may reference rows of the rolled back block
+            utxos.clear()
+            addresses.clear()
+            raise
+        invalidate_pages()
+        counts.update(block_counts)
+        log.info(
+            "imported %s transactions from block %s"
+            % (block_counts["transactions"], block_obj.height)
+        )
 
-    for block_obj in queryset:
+    log.info("imported %s transactions" % counts["transactions"])
+    log.info("imported %s outputs" % counts["outputs"])
+    log.info("imported %s inputs" % counts["inputs"])
+    log.info("upserted %s addresses" % counts["addresses"])
 
-        block_data = api.getblock(block_obj.hash, 4)
-        tx_hashes = [item["txid"] for item in block_data["tx"]]
-        tx_objs = []
 
-        for tx_idx, tx_hash in enumerate(tx_hashes):
-            tx_obj = Transaction(hash=tx_hash, block=block_obj, idx=tx_idx)
-            tx_objs.append(tx_obj)
-            tx_counter += 1
+def ingest_block(height, block_data, loader, deferred=False):
+    """Import transactions, outputs and inputs of a verbose (=4) block.
 
-        # only postgres sets primary ids for tx_objs here.
-        Transaction.objects.bulk_create(tx_objs)
+    Returns a Counter with the number of imported rows per kind.
+    """
+    counts = Counter()
 
-        tx_objs_by_hash = {txo.hash: txo for txo in tx_objs}
+    tx_rows = []
+    for tx_idx, item in enumerate(block_data["tx"]):
+        tx_rows.append((item["txid"], height, tx_idx))
+        counts["transactions"] += 1
 
-        # create outputs for all transactions in block
-        out_objs = []
-        for tx_data in block_data["tx"]:
-            if tx_data is None:
-                continue
+    tx_ids = loader.insert(Transaction, ("hash", "block_id", "idx"), tx_rows)
+    tx_id_map = {row[0]: tx_id for row, tx_id in zip(tx_rows, tx_ids)}
 
-            tx_obj = tx_objs_by_hash[tx_data["txid"]]
-
-            # Create new outputs
-            for out_entry in tx_data["vout"]:
-                value = out_entry.get("value")
-
-                try:
-                    address = out_entry["scriptPubKey"]["addresses"][0]
-                except KeyError:
-                    address = None
-                out_idx = out_entry["n"]
-
-                if address and address not in addrs_existing:
-                    Address.objects.create(address=address)
-                    addrs_existing.add(address)
-                    addr_counter += 1
-
-                out_objs.append(
-                    Output(
-                        transaction=tx_obj,
-                        out_idx=out_idx,
-                        value=value,
-                        address_id=address,
-                    )
-                )
-                out_counter += 1
+    # create outputs for all transactions in block
+    out_rows = []
+    out_refs = []
+    for tx_data in block_data["tx"]:
+        if tx_data is None:
+            continue
 
-        # postgres needed to set object ids
-        Output.objects.bulk_create(out_objs)
+        # Create new outputs
+        for out_entry in tx_data["vout"]:
+            value = out_entry.get("value")
 
-        # create inputs for all transactions in block
-        in_objs = []
-        for tx_data in block_data["tx"]:
-            if tx_data is None:
-                continue
+            try:
+                address = out_entry["scriptPubKey"]["addresses"][0]
+            except KeyError:
+                address = None
+            out_idx = out_entry["n"]
+
+            out_rows.append((tx_id_map[tx_data["txid"]], out_idx, value, address))
+            out_refs.append((tx_data["txid"], out_idx))
+            counts["outputs"] += 1
+
+    counts["addresses"] += addresses.ensure(row[3] for row in out_rows)
+    out_ids = loader.insert(
+        Output, ("transaction_id", "out_idx", "value", "address_id"), out_rows
+    )
+    for (txid, out_idx), out_id in zip(out_refs, out_ids):
+        utxos.add(txid, out_idx, out_id)
+    received = [
+        (address, height, txid, value)
+        for (_, _, value, address), (txid, _) in zip(out_rows, out_refs)
+    ]
+
+    # resolve outputs spent in this block
+    outpoints = [
+        (vin_entry["txid"], vin_entry["vout"])
+        for tx_data in block_data["tx"]
+        if tx_data is not None
+        for vin_entry in tx_data["vin"]
+        if vin_entry.get("txid")
+    ]
+    spends = utxos.resolve(outpoints)
+
+    # create inputs for all transactions in block
+    in_rows = []
+    spent_refs = []
+    for tx_data in block_data["tx"]:
+        if tx_data is None:
+            continue
+
+        # Create input and remember spent outputs
+        tx_id = tx_id_map[tx_data["txid"]]
+        for vin_entry in tx_data["vin"]:
+            txid = vin_entry.get("txid")
+            coinbase = vin_entry.get("coinbase")
+            vout = vin_entry.get("vout")
+            if txid:
+                spent_refs.append((len(in_rows), txid, vout))
+                in_rows.append((tx_id, spends.get((txid, vout)), False))
+                counts["inputs"] += 1
+            if coinbase:
+                in_rows.append((tx_id, None, True))
+                counts["inputs"] += 1
+    in_ids = loader.insert(Input, ("transaction_id", "spends_id", "coinbase"), in_rows)
+
+    # link inputs not found in the utxo index and mark spent outputs
+    spend_rows = [
+        (in_ids[row_idx], txid, vout, in_rows[row_idx][1])
+        for row_idx, txid, vout in spent_refs
+    ]
+    if deferred:
+        pending_rows = [row[:3] for row in spend_rows if row[3] is None]
+        loader.insert(PendingSpend, ("input_id", "txid", "vout"), pending_rows)
+        spend_rows = [row for row in spend_rows if row[3] is not None]
+    spent = link_spends(spend_rows)
+    if len(spent) != len(spend_rows):
+        raise SyncError(
+            "%s outputs spent in block %s not found"
+            % (len(spend_rows) - len(spent), height)
+        )
 
-            tx_obj = tx_objs_by_hash[tx_data["txid"]]
-            # Create input and mark spent outputs
-            for vin_entry in tx_data["vin"]:
-                txid = vin_entry.get("txid")
-                coinbase = vin_entry.get("coinbase")
-                vout = vin_entry.get("vout")
-                if txid:
-                    out = Output.objects.get(transaction__hash=txid, out_idx=vout)
-
-                    in_objs.append(
-                        Input(transaction=tx_obj, spends=out, coinbase=False)
-                    )
-                    in_counter += 1
-                    out.spent = True
-                    out.save()
-                if coinbase:
-                    in_objs.append(Input(transaction=tx_obj, coinbase=True))
-                    in_counter += 1
-        Input.objects.bulk_create(in_objs)
-        log.info(
-            "imported %s transactions from block %s" % (len(tx_objs), block_obj.height)
+    tx_hashes = {tx_id: txid for txid, tx_id in tx_id_map.items()}
+    sent = [
+        (address, height, tx_hashes[tx_id], value) for address, value, tx_id in spent
+    ]
+    loader.insert(AddressActivity, ACTIVITY_FIELDS, activity_rows(received, sent))
+
+    # single balance update per block keeps row locks in address order
+    update_balances(
+        tally(
+            credits=[(row[0], row[3]) for row in received],
+            debits=[(row[0], row[3]) for row in sent],
         )
+    )
+
+    return counts
+
+
+def sync_parallel(processes, chunk_size=settings.MEX_SYNC_PARALLEL_CHUNK):
+    """
+    Import all new blocks with `processes` worker processes.
+
+    Block headers are imported first. The worker processes then import the
+    transactions, outputs and inputs of independent height ranges of
+    `chunk_size` blocks each. Inputs spending outputs from other ranges are
+    linked in a final set-based pass once all ranges are done.
+    """
+    clean_reorgs()
+    sync_blocks()
+    link_pending_spends()
+
+    heights = Block.objects.filter(ingested=False).aggregate(
+        start=Min("height"), stop=Max("height")
+    )
+    if heights["start"] is None:
+        return
+
+    chunks = [
+        (start, min(start + chunk_size - 1, heights["stop"]), processes)
+        for start in range(heights["start"], heights["stop"] + 1, chunk_size)
+    ]
+    log.info(
+        "sync transactions from blocks %s-%s in %s chunks with %s processes"
+        % (heights["start"], heights["stop"], len(chunks), processes)
+    )
+
+    # forked workers must not share the database connection of the parent
+    connections.close_all()
+    with multiprocessing.Pool(processes) as pool:
+        for start, stop, _ in pool.imap_unordered(_sync_chunk, chunks):
+            log.info("finished chunk %s-%s" % (start, stop))
+
+    unlinked = link_pending_spends()
+    if unlinked:
+        raise SyncError("%s inputs could not be linked to outputs" % unlinked)
+    update_sync_state()
+
+
+def update_sync_state():
+    """Set the "transactions" cursor to the last contiguously ingested block."""
+    pending = Block.objects.filter(ingested=False).aggregate(first=Min("height"))
+    if pending["first"] is not None:
+        height = pending["first"] - 1
+    else:
+        height = Block.get_db_height()
+    if height != SyncState.get_height("transactions"):
+        SyncState.set_height("transactions", height)
+        invalidate_pages()
+
 
-    log.info("imported %s transactions" % tx_counter)
-    log.info("imported %s outputs" % out_counter)
-    log.info("imported %s inputs" % in_counter)
-    log.info("imported %s addresses" % addr_counter)
+def _sync_chunk(chunk):
+    start, stop, processes = chunk
+    sync_transactions(start=start, stop=stop, deferred=True, writers=processes)
+    connections.close_all()
+    return chunk
 
 
 if __name__ == "__main__":
+    import argparse
     import time
     import timeit
+    from mex.notify import BlockNotifyListener
     from mex.tools import init_logging
 
+    parser = argparse.ArgumentParser(description="Synchronize database with node")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of processes for the initial sync (default: 1)",
+    )
+    args = parser.parse_args()
+
     init_logging()
 
+    listener = None
+    if settings.MEX_SYNC_NOTIFY_PORT:
+        listener = BlockNotifyListener()
+        listener.start()
+
+    parallel = args.workers > 1
     while True:
-        log.info("starting sync round")
         start = timeit.default_timer()
         try:
+            if parallel:
+                log.info("starting parallel sync with %s workers" % args.workers)
+                sync_parallel(args.workers)
+                parallel = False
+                log.info(
+                    "finished parallel sync in %s seconds"
+                    % (timeit.default_timer() - start)
+                )
+                continue
+            log.info("starting sync round")
             clean_reorgs()
             sync_blocks()
             sync_transactions()
+            update_sync_state()
+            link_pending_spends()
+            sync_streams()
+            sync_permissions()
             stop = timeit.default_timer()
             runtime = stop - start
             log.info("finished sync round in %s seconds" % runtime)
@@ -235,4 +599,7 @@ if __name__ == "__main__":
                 log.warning("reconnect to db failed")
         except Exception as e:
             log.error(repr(e))
-        time.sleep(10)
+        if listener is None:
+            time.sleep(settings.MEX_SYNC_INTERVAL)
+        elif listener.wait(settings.MEX_SYNC_INTERVAL):
+            log.info("received block notification")
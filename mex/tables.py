@@ -6,18 +6,16 @@ from django.urls import reverse
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from django_tables2 import tables, Column, DateTimeColumn, LinkColumn
-from mex.models import Block, Transaction, Address
+from mex.models import Block, Transaction, AddressActivity, AddressBalance, StreamItem
 
 
 class BlockTable(tables.Table):
 
-    height = LinkColumn(verbose_name="Height", orderable=True)
-    time = DateTimeColumn(
-        verbose_name="Time (UTC)", format="Y-m-d H:i:s", orderable=True
-    )
+    height = LinkColumn(verbose_name="Height")
+    time = DateTimeColumn(verbose_name="Time (UTC)", format="Y-m-d H:i:s")
     miner = LinkColumn(verbose_name=settings.MEX_MINER)
-    txcount = Column(verbose_name="TXs", orderable=True)
-    size = Column(orderable=True)
+    txcount = Column(verbose_name="TXs")
+    size = Column()
 
     class Meta:
         model = Block
@@ -50,6 +48,7 @@ class TransactionTable(tables.Table):
         fields = ("block", "hash", "idx")
         attrs = {"class": "table table-sm table-striped table-hover"}
         order_by = ("-block", "idx")
+        orderable = False
 
     def render_block(self, record=None):
         link = reverse("block-detail", args=[str(record.block.hash)])
@@ -63,10 +62,10 @@ class TransactionTable(tables.Table):
 class AddressTable(tables.Table):
 
     address = LinkColumn(verbose_name="Address")
-    balance = Column(verbose_name="Balance", orderable=True)
+    balance = Column(verbose_name="Balance")
 
     class Meta:
-        model = Address
+        model = AddressBalance
         fields = ("address", "balance")
         attrs = {"class": "table table-sm table-striped table-hover"}
         order_by = ("-balance",)
@@ -76,6 +75,38 @@ class AddressTable(tables.Table):
         return "%s %s" % (value, settings.MEX_SYMBOL)
 
 
+class AddressActivityTable(tables.Table):
+
+    block = Column(verbose_name="Block")
+    time = DateTimeColumn(
+        verbose_name="Time (UTC)", accessor="block.time", format="Y-m-d H:i:s"
+    )
+    txid = Column(verbose_name="Transaction")
+    direction = Column(verbose_name="Direction")
+    value = Column(verbose_name="Value")
+
+    class Meta:
+        model = AddressActivity
+        fields = ("block", "time", "txid", "direction", "value")
+        attrs = {"class": "table table-sm table-striped table-hover"}
+        orderable = False
+
+    def render_block(self, record=None):
+        link = reverse("block-detail", args=[str(record.block.hash)])
+        return mark_safe(
+            '<a href="{}" class="badge badge-info"><i class="fas fa-cube"></i>  {}</a>'.format(
+                link, record.block_id
+            )
+        )
+
+    def render_txid(self, value):
+        link = reverse("transaction-detail", args=[value])
+        return format_html('<a href="{}">{}</a>', link, value)
+
+    def render_value(self, value):
+        return "%s %s" % (value, settings.MEX_SYMBOL)
+
+
 class ListStreamTable(tables.Table):
 
     name = Column(verbose_name="Stream")
@@ -84,16 +115,6 @@ class ListStreamTable(tables.Table):
     items = Column()
     restrict = Column(verbose_name="Open")
 
-    streams = {
-        "alias": "Address alias registrations",
-        "DOI": "Open Stream that maps DOI to ISCC",
-        "ISBN": "Open Stream that maps ISBN to ISCC",
-        "iscc": "Public ISCC Registry",
-        "smart-license": "Public Smart License Registry",
-        "test": "Stream for test data",
-        "timestamp": "Open timestamping with SHA-256",
-    }
-
     class Meta:
         attrs = {"class": "table table-sm table-striped table-hover"}
 
@@ -103,7 +124,7 @@ class ListStreamTable(tables.Table):
     def render_details(self, value, record):
         value = value.get("info")
         if not value:
-            value = self.streams.get(record["name"])
+            value = settings.MEX_STREAMS.get(record["name"])
         return value
 
     def render_restrict(self, value):
@@ -156,3 +177,23 @@ class StreamItemApiTable(tables.Table):
         if not title:
             title = str(value)
         return title[:64] if title else ""
+
+
+class StreamItemTable(StreamItemApiTable):
+    """Stream items served from the database index."""
+
+    time = Column(verbose_name="Time (UTC)", orderable=False)
+
+    class Meta:
+        model = StreamItem
+        fields = ("txid", "time", "keys", "data")
+        attrs = {"class": "table table-sm table-striped table-hover"}
+        orderable = False
+
+    def render_time(self, value):
+        return value.astimezone(pytz.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+    def render_keys(self, value, record):
+        key = "{}:{}".format(record.txid, record.vout)
+        link = reverse("stream-item-detail", args=[record.stream_id, key])
+        return format_html('<a href="{}">{}</a>', link, "-".join(value)[:55])
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+import pytz
+from django.test import TestCase
+from mex.models import Address, Block, Input, Output, Transaction
+
+
+TX_HASH = "ab" * 32
+
+
+class StrTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        block = Block.objects.create(
+            height=0,
+            hash="01" * 32,
+            merkleroot="02" * 32,
+            time=datetime(2020, 1, 1, tzinfo=pytz.utc),
+            txcount=1,
+            size=100,
+        )
+        tx = Transaction.objects.create(hash=TX_HASH, block=block, idx=0)
+        address = Address.objects.create(address="1addr")
+        output = Output.objects.create(
+            transaction=tx, out_idx=1, value=1, address=address
+        )
+        Input.objects.create(transaction=tx, spends=output, coinbase=False)
+
+    def test_transaction_str(self):
+        tx = Transaction.objects.get()
+        self.assertEqual(str(tx), TX_HASH)
+        self.assertEqual(tx.natural_key(), TX_HASH)
+
+    def test_output_str(self):
+        output = Output.objects.get()
+        self.assertEqual(str(output), "%s:1" % TX_HASH)
+        self.assertEqual(output.natural_key(), "%s:1" % TX_HASH)
+
+    def test_input_str(self):
+        self.assertEqual(str(Input.objects.get()), "%s:1" % TX_HASH)
+
+    def test_block_natural_key(self):
+        self.assertEqual(Block.objects.get().natural_key(), "01" * 32)
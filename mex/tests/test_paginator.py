@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from mex.models import Address, AddressBalance
+from mex.paginator import KeysetPaginator
+
+
+class KeysetPaginatorTest(TestCase):
+    keys = ("-balance", "address_id")
+
+    @classmethod
+    def setUpTestData(cls):
+        for n in range(25):
+            address = Address.objects.create(address="1addr%02d" % n)
+            # equal balances make the address decide the order
+            AddressBalance.objects.create(address=address, balance=n // 3)
+
+    def paginator(self, **kwargs):
+        return KeysetPaginator(AddressBalance.objects.all(), 4, self.keys, **kwargs)
+
+    def test_walks_all_rows_forward_and_back(self):
+        expected = list(
+            AddressBalance.objects.order_by(*self.keys).values_list(
+                "address_id", flat=True
+            )
+        )
+        pages, cursor = [], None
+        while True:
+            page = self.paginator(after=cursor).page()
+            pages.append([row.address_id for row in page.object_list])
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(sum(pages, []), expected)
+
+        back, cursor = [pages[-1]], self.paginator(after=cursor).page().previous_cursor
+        while cursor:
+            page = self.paginator(before=cursor).page()
+            back.insert(0, [row.address_id for row in page.object_list])
+            cursor = page.previous_cursor
+        self.assertEqual(back, pages)
+
+    def test_page_is_one_query(self):
+        cursor = self.paginator().page().next_cursor
+        with self.assertNumQueries(1):
+            self.paginator(after=cursor).page()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+import pytz
+from django.db import connection
+from django.test import TestCase
+from mex import partitions
+from mex.models import Block, Output, Transaction
+
+
+class EnsurePartitionsTest(TestCase):
+    size = 10
+
+    def setUp(self):
+        partitions.partition_tables(self.size)
+        block = Block.objects.create(
+            height=0,
+            hash="01" * 32,
+            merkleroot="02" * 32,
+            time=datetime(2020, 1, 1, tzinfo=pytz.utc),
+            txcount=1,
+            size=100,
+        )
+        self.tx = Transaction.objects.create(hash="ab" * 32, block=block, idx=0)
+
+    def tearDown(self):
+        partitions._limits = None
+        partitions._budget.clear()
+
+    def add_outputs(self, count):
+        start = Output.objects.count()
+        Output.objects.bulk_create(
+            Output(transaction=self.tx, out_idx=start + i, value=1)
+            for i in range(count)
+        )
+        return {Output: count}
+
+    def partition_limit(self):
+        with connection.cursor() as cursor:
+            return partitions.partition_limit(cursor, Output._meta.db_table)
+
+    def test_skips_sequences_within_budget(self):
+        partitions.ensure_partitions(size=self.size)
+        used = self.add_outputs(2)
+        with self.assertNumQueries(0):
+            partitions.ensure_partitions(used, size=self.size)
+
+    def test_creates_partition_when_budget_is_used_up(self):
+        partitions.ensure_partitions(size=self.size)
+        limit = self.partition_limit()
+        used = self.add_outputs(partitions._budget[Output._meta.db_table])
+        partitions.ensure_partitions(used, size=self.size)
+        self.assertGreater(self.partition_limit(), limit)
+        # the ids of these rows exceed the previous partitions
+        self.add_outputs(self.size)
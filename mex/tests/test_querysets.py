@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+from decimal import Decimal
+from django.test import TestCase
+from mex.models import Address, AddressBalance
+
+
+class WithBalanceTest(TestCase):
+    def test_addresses_without_balance_row(self):
+        AddressBalance.objects.create(
+            address=Address.objects.create(address="1rich"), balance=5
+        )
+        Address.objects.create(address="1new")
+        balances = dict(
+            Address.objects.with_balance().values_list("address", "balance")
+        )
+        self.assertEqual(balances, {"1rich": Decimal(5), "1new": Decimal(0)})
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import socketserver
+import threading
+from unittest import mock
+import requests
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+from mex import rpc
+
+
+class FakeNodeHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        length = 0
+        for line in iter(self.rfile.readline, b"\r\n"):
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":")[1])
+        self.rfile.read(length)
+        self.server.requests += 1
+        if self.server.mode == "drop" and self.server.requests == 1:
+            return
+        if self.server.mode == "silent":
+            self.server.release.wait(5)
+            return
+        body = b'{"result": 7, "error": null, "id": null}'
+        self.wfile.write(
+            b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+        )
+
+
+class RetryTest(SimpleTestCase):
+    def setUp(self):
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeNodeHandler)
+        self.server.daemon_threads = True
+        self.server.requests = 0
+        self.server.release = threading.Event()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        settings = override_settings(
+            NODE_IP="127.0.0.1",
+            NODE_PORT=self.server.server_address[1],
+            MEX_RPC_TIMEOUT=0.5,
+            MEX_RPC_RETRIES=3,
+            MEX_RPC_BACKOFF=0,
+            MEX_RPC_COALESCE=False,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        rpc._session = None
+        self.addCleanup(setattr, rpc, "_session", None)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(self.server.release.set)
+
+    def test_read_timeout_is_not_resent(self):
+        self.server.mode = "silent"
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            rpc.get_client().getblockcount()
+        self.assertEqual(self.server.requests, 1)
+
+    def test_dropped_connection_is_resent(self):
+        self.server.mode = "drop"
+        self.assertEqual(rpc.get_client().getblockcount(), 7)
+        self.assertEqual(self.server.requests, 2)
+
+
+@override_settings(
+    MEX_RPC_CONNECT_TIMEOUT=0.2,
+    MEX_RPC_TIMEOUT=0.2,
+    MEX_RPC_RETRIES=1,
+    MEX_RPC_BACKOFF=0.1,
+    MEX_RPC_COALESCE_CACHE="default",
+)
+class SharedRequestTest(SimpleTestCase):
+    def tearDown(self):
+        caches["default"].clear()
+
+    def test_max_request_time_covers_retries(self):
+        # (0.2 + 0.2) * 2 tries + 0.1 + 0.2 backoff
+        self.assertEqual(rpc.max_request_time(), 2)
+
+    def test_follower_waits_for_retrying_leader(self):
+        cache = caches["default"]
+        cache.add("mex:rpc:lock:key", True, rpc.max_request_time())
+        # the leader answers after its first read timeout
+        threading.Timer(0.5, cache.set, ["mex:rpc:content:key", b"shared"]).start()
+        client = rpc.get_client()
+        with mock.patch.object(client, "_send", side_effect=AssertionError):
+            self.assertEqual(client._send_shared("key", "{}"), b"shared")
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from unittest import mock
+import pytz
+from django.test import TestCase, override_settings
+from mex.models import Block, Stream, StreamItem
+from mex.sync import clean_reorgs, sync_streams
+
+
+class FakeNode:
+    """Node with a chain of empty blocks and one item per block in "iscc"."""
+
+    def __init__(self, height):
+        self.hashes = []
+        self.extend(height)
+
+    def extend(self, height, fork_at=None, salt=""):
+        if fork_at is not None:
+            del self.hashes[fork_at:]
+        for h in range(len(self.hashes), height + 1):
+            self.hashes.append(("%02x" % h) * 31 + (salt or "00"))
+
+    def getblockhash(self, height):
+        return self.hashes[height]
+
+    def liststreams(self, streams, verbose):
+        return [
+            {"name": "iscc", "items": len(self.hashes), "subscribed": True},
+            {"name": "smart-license", "items": 0, "subscribed": False},
+            {"name": "test", "items": 0, "subscribed": True},
+        ]
+
+    def liststreamitems(self, stream, verbose, count, start, local_ordering):
+        items = [
+            {
+                "blockhash": block_hash,
+                "blocktime": 1577836800 + h,
+                "txid": block_hash[:62] + "ff",
+                "vout": 0,
+                "keys": ["key%s" % h],
+                "publishers": [],
+                "data": {"json": {}},
+            }
+            for h, block_hash in enumerate(self.hashes)
+            if stream == "iscc"
+        ]
+        return items[start : start + count]
+
+
+class SyncStreamsTest(TestCase):
+    def setUp(self):
+        self.node = FakeNode(5)
+        patcher = mock.patch("mex.sync.get_client", return_value=self.node)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.import_blocks()
+
+    def import_blocks(self):
+        for height, block_hash in enumerate(self.node.hashes):
+            Block.objects.get_or_create(
+                height=height,
+                defaults=dict(
+                    hash=block_hash,
+                    previousblockhash=self.node.hashes[height - 1] if height else None,
+                    merkleroot="00" * 32,
+                    time=datetime(2020, 1, 1, tzinfo=pytz.utc),
+                    txcount=0,
+                    size=0,
+                ),
+            )
+
+    def assertItemsCounted(self):
+        for stream in Stream.objects.all():
+            self.assertEqual(stream.items, stream.stream_items.count())
+
+    @override_settings(MEX_IGNORE_STREAMS=["test"])
+    def test_skips_ignored_and_unsubscribed_streams(self):
+        sync_streams()
+        self.assertEqual(list(Stream.objects.values_list("name", flat=True)), ["iscc"])
+
+    def test_resync_after_reorg(self):
+        sync_streams()
+        self.assertEqual(StreamItem.objects.count(), 6)
+        self.assertItemsCounted()
+
+        self.node.extend(7, fork_at=3, salt="01")
+        clean_reorgs()
+        self.assertEqual(Block.get_db_height(), 2)
+        self.assertItemsCounted()
+
+        self.import_blocks()
+        sync_streams()
+        self.assertEqual(StreamItem.objects.count(), 8)
+        self.assertItemsCounted()
+        self.assertEqual(
+            set(StreamItem.objects.values_list("block_id", flat=True)), set(range(8))
+        )
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+from django.test import TestCase
+from mex.models import Stream
+
+
+class TipCacheTest(TestCase):
+    def test_query_string_is_part_of_the_key(self):
+        plain = self.client.get("/table/blocks")
+        query = self.client.get("/table/blocks", {"page": 2})
+        self.assertEqual(plain.status_code, 200)
+        self.assertNotEqual(plain["ETag"], query["ETag"])
+        again = self.client.get("/table/blocks", {"page": 2})
+        self.assertEqual(query["ETag"], again["ETag"])
+
+
+class StreamsViewTest(TestCase):
+    def test_lists_unindexed_streams_of_the_node(self):
+        Stream.objects.create(name="iscc", items=5)
+        listed = [
+            dict(name=name, items=7, details={}, creators=[], restrict={"read": False})
+            for name in ("iscc", "timestamp", "unlisted")
+        ]
+        with mock.patch("mex.views.get_client") as get_client:
+            get_client.return_value.liststreams.return_value = listed
+            response = self.client.get("/streams/")
+        items = {row["name"]: row["items"] for row in response.context["table"].data}
+        self.assertEqual(items, {"iscc": 5, "timestamp": 7})
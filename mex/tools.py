@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 
 log = logging.getLogger(__name__)
@@ -27,3 +30,48 @@ def batchwise(rng: range, batch_size):
     for i in range(0, len(rng) + 1, batch_size):
         batch = rng[i : i + batch_size - 1]
         yield "{}-{}".format(batch.start, batch.stop)
+
+
+def chunked(items, size):
+    """Iterate over lists of up to `size` consecutive items.
+
+    list(chunked(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    """
+    items = iter(items)
+    chunk = list(islice(items, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(items, size))
+
+
+def prefetch(func, items, depth=32, workers=4):
+    """Ordered read-ahead of `func(item)` for all `items`.
+
+    A pool of `workers` threads computes up to `depth` results ahead while the
+    consumer receives them strictly in input order. With `workers=0` results
+    are computed sequentially in the calling thread.
+
+    list(prefetch(lambda x: x * 2, range(5), depth=2, workers=2))
+    [0, 2, 4, 6, 8]
+    """
+    if workers < 1:
+        for item in items:
+            yield func(item)
+        return
+
+    items = iter(items)
+    pending = deque()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for item in islice(items, max(depth, 1)):
+            pending.append(pool.submit(func, item))
+        while pending:
+            result = pending.popleft().result()
+            for item in islice(items, 1):
+                pending.append(pool.submit(func, item))
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
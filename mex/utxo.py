@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import logging
+from binascii import unhexlify
+from collections import OrderedDict
+from django.conf import settings
+
+
+log = logging.getLogger(__name__)
+
+
+class UtxoIndex:
+    """In-memory map of unspent outputs from (txid, vout) to `Output` ids.
+
+    Entries are keyed by the raw 32 byte txid followed by the 4 byte output
+    index to keep the index compact. Once `max_size` entries are reached the
+    oldest outputs are evicted and must be resolved from the database.
+    """
+
+    def __init__(self, max_size=settings.MEX_SYNC_UTXO_CACHE_SIZE):
+        self.max_size = max_size
+        self._index = OrderedDict()
+
+    def __len__(self):
+        return len(self._index)
+
+    @staticmethod
+    def _key(txid, vout):
+        return unhexlify(txid) + vout.to_bytes(4, "little")
+
+    def add(self, txid, vout, output_id):
+        if output_id is None or self.max_size < 1:
+            return
+        self._index[self._key(txid, vout)] = output_id
+        if len(self._index) > self.max_size:
+            self._index.popitem(last=False)
+
+    def clear(self):
+        self._index.clear()
+
+    def resolve(self, outpoints):
+        """Resolve (txid, vout) pairs to output ids and remove them from the index.
+
+        Returns a dict of resolved outpoints to output ids. Outpoints missing
+        from the index are left to the caller to resolve from the database.
+        """
+        resolved = {}
+        for txid, vout in outpoints:
+            output_id = self._index.pop(self._key(txid, vout), None)
+            if output_id is not None:
+                resolved[(txid, vout)] = output_id
+        return resolved
@@ -1,22 +1,108 @@
 # -*- coding: utf-8 -*-
 import datetime
+import hashlib
 from django.conf import settings
-from django.views.generic import DetailView, TemplateView
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db.models import F, Prefetch
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import cached_property
+from django.views.generic import DetailView, ListView, TemplateView
 from django_tables2 import MultiTableMixin, SingleTableView, SingleTableMixin
 from mcrpc.exceptions import RpcError
+from mex.pagecache import tip_key
+from mex.paginator import KeysetPaginator, estimate_count
 from mex.rpc import get_client
 from mex.stream import LazyStream, TableDataLen
 from mex.tables import (
     BlockTable,
     TransactionTable,
     AddressTable,
+    AddressActivityTable,
     StreamItemApiTable,
+    StreamItemTable,
     ListStreamTable,
 )
-from mex.models import Block, Transaction, Address, Output
+from mex.models import (
+    Block,
+    Transaction,
+    Input,
+    Output,
+    Address,
+    AddressBalance,
+    Permission,
+    Stream,
+    StreamItem,
+    SyncState,
+)
 from mex.utils import public_key_to_address, iscc_split, is_iscc
 
 
+class KeysetTableMixin(SingleTableMixin):
+    """Page the table with `after`/`before` cursors on the `keyset` ordering."""
+
+    keyset = None
+
+    def get_table_count(self):
+        return None
+
+    def get_paginate_by(self, queryset):
+        # the table pages itself, keeps ListView from counting the queryset
+        return None
+
+    def get_table(self, **kwargs):
+        paginator = KeysetPaginator(
+            self.get_table_data(),
+            self.paginate_by,
+            self.keyset,
+            after=self.request.GET.get("after"),
+            before=self.request.GET.get("before"),
+            count=self.get_table_count(),
+        )
+        try:
+            page = paginator.page()
+        except ValidationError:
+            raise Http404("Invalid cursor")
+        table = self.get_table_class()(
+            page.object_list,
+            order_by=(),
+            template_name="mex/table_keyset.html",
+            request=self.request,
+            **kwargs
+        )
+        # the table template renders the page as bound rows
+        page.object_list = table.rows
+        table.paginator, table.page = paginator, page
+        return table
+
+
+class TipCacheMixin:
+    """Cache the page until new blocks are indexed and answer If-None-Match."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return super().dispatch(request, *args, **kwargs)
+
+        # the query string selects pages, cursors and sorting
+        digest = hashlib.md5(("%s %s" % (tip_key(), request.get_full_path())).encode())
+        etag = '"%s"' % digest.hexdigest()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            cache = caches[settings.MEX_PAGE_CACHE]
+            key = "mex:page:%s" % digest.hexdigest()
+            response = cache.get(key)
+            if response is None:
+                response = super().dispatch(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                response.render()
+                cache.set(key, response, settings.MEX_PAGE_CACHE_TTL)
+        response["ETag"] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
 class StatusView(TemplateView):
     template_name = "mex/status.html"
 
@@ -24,53 +110,94 @@ class StatusView(TemplateView):
         api = get_client()
         ctx = super().get_context_data(**kwargs)
         ctx["info"] = api.getinfo()
+        ctx["db_height"] = Block.get_db_height()
+        ctx["sync_height"] = SyncState.get_height("transactions")
         return ctx
 
 
-class HomeView(MultiTableMixin, TemplateView):
+def latest_blocks():
+    return Block.objects.select_related("miner").order_by("-height")[:6]
+
+
+def latest_transactions():
+    return Transaction.objects.select_related("block").order_by("-block", "idx")[:6]
+
+
+class HomeView(TipCacheMixin, MultiTableMixin, TemplateView):
 
     template_name = "mex/home.html"
-    tables = [
-        BlockTable(Block.objects.all()),
-        TransactionTable(Transaction.objects.all()),
-    ]
-    table_pagination = {"per_page": 6}
+    table_pagination = False
+
+    def get_tables(self):
+        return [
+            BlockTable(latest_blocks(), order_by=()),
+            TransactionTable(latest_transactions(), order_by=()),
+        ]
 
 
-class TableBlocks(SingleTableView):
+class TableBlocks(TipCacheMixin, SingleTableView):
     template_name = "mex/table_simple.html"
-    model = Block
     table_class = BlockTable
-    paginate_by = 6
+    table_pagination = False
 
+    def get_queryset(self):
+        return latest_blocks()
 
-class TableTransactions(SingleTableView):
+    def get_table_kwargs(self):
+        return {"order_by": ()}
+
+
+class TableTransactions(TipCacheMixin, SingleTableView):
     template_name = "mex/table_simple.html"
-    model = Transaction
     table_class = TransactionTable
-    paginate_by = 6
+    table_pagination = False
+
+    def get_queryset(self):
+        return latest_transactions()
 
+    def get_table_kwargs(self):
+        return {"order_by": ()}
 
-class BlockListView(SingleTableView):
+
+class BlockListView(KeysetTableMixin, ListView):
     model = Block
     table_class = BlockTable
     paginate_by = 17
+    keyset = ("-height",)
+
+    def get_queryset(self):
+        return super().get_queryset().select_related("miner")
+
+    def get_table_count(self):
+        return Block.get_db_height() + 1
 
 
-class TransactionListView(SingleTableView):
+class TransactionListView(KeysetTableMixin, ListView):
     model = Transaction
     table_class = TransactionTable
     paginate_by = 17
+    keyset = ("-block", "idx")
 
+    def get_queryset(self):
+        return super().get_queryset().select_related("block")
 
-class AddressListView(SingleTableView):
-    model = Address
+    def get_table_count(self):
+        return estimate_count(Transaction)
+
+
+class AddressListView(KeysetTableMixin, ListView):
+    model = AddressBalance
+    template_name = "mex/address_list.html"
     table_class = AddressTable
     paginate_by = 17
+    keyset = ("-balance", "address_id")
 
     def get_queryset(self):
-        qs = super().get_queryset()
-        return qs.with_balance()
+        # every indexed address has a balance row, pages follow mex_balance_idx
+        return super().get_queryset().select_related("address")
+
+    def get_table_count(self):
+        return estimate_count(AddressBalance)
 
 
 class StreamsView(SingleTableMixin, TemplateView):
@@ -80,22 +207,62 @@ class StreamsView(SingleTableMixin, TemplateView):
     paginate_by = 17
 
     def get_table_data(self):
-        client = get_client()
-        streams = client.liststreams("*", verbose=True)
-        streams = [e for e in streams if e["name"] in ListStreamTable.streams]
+        # the node lists all streams, indexed ones show their confirmed items
+        indexed = dict(Stream.objects.values_list("name", "items"))
+        streams = get_client().liststreams("*", verbose=True)
+        streams = [dict(e) for e in streams if e["name"] in settings.MEX_STREAMS]
+        for stream in streams:
+            if stream["name"] in indexed:
+                stream["items"] = indexed[stream["name"]]
         return streams
 
 
-class StreamItemApiTableView(SingleTableMixin, TemplateView):
+class StreamItemApiTableView(KeysetTableMixin, TemplateView):
+    """Stream items from the database index or from the node if not indexed."""
 
     template_name = "mex/stream_item_list.html"
-    table_class = StreamItemApiTable
+    table_class = StreamItemTable
     paginate_by = 17
 
-    def get_table_data(self):
+    @cached_property
+    def stream(self):
+        return Stream.objects.filter(name=self.kwargs["stream"]).first()
+
+    @cached_property
+    def keys(self):
         keys = self.request.GET.get("keys")
-        stream = self.kwargs["stream"]
         if keys is None or not keys.strip():
+            return None
+        if is_iscc(keys):
+            return iscc_split(keys)
+        return [keys.strip()]
+
+    @property
+    def keyset(self):
+        if self.keys is None and self.request.GET.get("sort") == "time":
+            return ("id",)
+        return ("-id",)
+
+    def get_table_class(self):
+        return StreamItemTable if self.stream else StreamItemApiTable
+
+    def get_table(self, **kwargs):
+        if self.stream:
+            return super().get_table(**kwargs)
+        return SingleTableMixin.get_table(self, **kwargs)
+
+    def get_table_count(self):
+        return self.stream.items if self.keys is None else None
+
+    def get_table_data(self):
+        if self.stream:
+            items = self.stream.stream_items.all()
+            if self.keys is not None:
+                items = items.filter(keys__overlap=self.keys)
+            return items
+
+        stream = self.kwargs["stream"]
+        if self.keys is None:
             sort = self.request.GET.get("sort", "-time")
             stream_itr = LazyStream(self.kwargs["stream"])
             if sort == "time":
@@ -103,13 +270,8 @@ class StreamItemApiTableView(SingleTableMixin, TemplateView):
             return TableDataLen(stream_itr)
 
         client = get_client()
-        if is_iscc(keys):
-            keys_clean = iscc_split(keys)
-        else:
-            keys_clean = [keys.strip()]
-
         results = []
-        for k in keys_clean:
+        for k in self.keys:
             result = client.liststreamkeyitems(stream, k, verbose=True)
             results.extend(result)
 
@@ -149,7 +311,7 @@ class BlockDetailView(DetailView):
         api = get_client()
         ctx = super().get_context_data(**kwargs)
         ctx["MEX_MINER"] = settings.MEX_MINER
-        ctx["details"] = api.getblock(ctx["block"].hash, 1)
+        ctx["details"] = api.getblock(str(ctx["block"].hash), 1)
         ctx["formattedtime"] = datetime.datetime.fromtimestamp(ctx["details"]["time"])
         ctx["num_transactions"] = len(ctx["details"]["tx"])
         return ctx
@@ -158,22 +320,87 @@ class BlockDetailView(DetailView):
 class TransactionDetailView(TemplateView):
     template_name = "mex/transaction_detail.html"
 
+    def get_transaction(self, txid):
+        """Return the indexed transaction with its inputs and outputs or None."""
+        outputs = Output.objects.order_by("out_idx").annotate(
+            spent_by=F("inputs_for_output__transaction__hash")
+        )
+        inputs = Input.objects.order_by("id").select_related(
+            "spends__transaction", "pendingspend"
+        )
+        try:
+            return (
+                Transaction.objects.filter(hash=txid, block__isnull=False)
+                .select_related("block")
+                .prefetch_related(
+                    Prefetch("outputs_for_tx", outputs),
+                    Prefetch("inputs_for_tx", inputs),
+                )
+                .first()
+            )
+        except ValidationError:
+            return None
+
     def get_context_data(self, **kwargs):
-        api = get_client()
         ctx = super().get_context_data(**kwargs)
-        tx_raw = api.getrawtransaction(ctx["hash"], 4)
-        if tx_raw.get("confirmations"):
-            try:
-                tx_db = Transaction.objects.get(hash=tx_raw["txid"])
-                outputs_db = tx_db.outputs_for_tx.order_by("out_idx")
-            except Transaction.DoesNotExist:
-                outputs_db = None
-        else:
-            outputs_db = None
+        ctx["raw"] = "raw" in self.request.GET
+        tx = self.get_transaction(ctx["hash"])
+        if tx is None:
+            return self.get_node_context(ctx)
+
+        block = tx.block
+        ctx["details"] = {
+            "txid": tx.hash,
+            "blockhash": block.hash,
+            "blocktime": int(block.time.timestamp()),
+            "confirmations": Block.get_db_height() - block.height + 1,
+        }
+        # the raw transaction is only fetched from the node on request
+        ctx["raw_loaded"] = ctx["raw"]
+        if ctx["raw"]:
+            ctx["details"] = get_client().getrawtransaction(str(tx.hash), 4)
+        ctx["formattedBlocktime"] = block.time
+        ctx["formattedVin"] = []
+        ctx["formattedVout"] = []
+
+        for index, vin in enumerate(tx.inputs_for_tx.all()):
+            address, transaction, vout = "N/A", "", 0
+            if vin.spends is not None:
+                address = vin.spends.address_id or address
+                transaction = vin.spends.transaction.hash
+                vout = vin.spends.out_idx
+            elif hasattr(vin, "pendingspend"):
+                transaction = vin.pendingspend.txid
+                vout = vin.pendingspend.vout
+            ctx["formattedVin"].append(
+                {
+                    "index": index,
+                    "address": address,
+                    "transaction": transaction,
+                    "vout": vout,
+                }
+            )
+
+        for vout in tx.outputs_for_tx.all():
+            ctx["formattedVout"].append(
+                {
+                    "index": vout.out_idx,
+                    "address": vout.address_id or "N/A",
+                    "transaction": vout.spent_by or "",
+                    "amount": vout.value,
+                }
+            )
+        return ctx
+
+    def get_node_context(self, ctx):
+        """Fill `ctx` from the node for transactions that are not indexed yet."""
+        api = get_client()
+        tx_raw, blockchain_params = api.batch(
+            [("getrawtransaction", ctx["hash"], 4), ("getblockchainparams",)]
+        )
 
         ctx["details"] = tx_raw
-        ctx["raw"] = "raw" in self.request.GET
-        blockchain_params = api.getblockchainparams()
+        ctx["raw_loaded"] = True
         pubkeyhash_version = blockchain_params["address-pubkeyhash-version"]
         checksum_value = blockchain_params["address-checksum-value"]
         if "blocktime" in ctx["details"]:
@@ -205,62 +432,41 @@ class TransactionDetailView(TemplateView):
             if "scriptPubKey" in vout and "addresses" in vout["scriptPubKey"]:
                 address = ", ".join(vout["scriptPubKey"]["addresses"])
 
-            if outputs_db and outputs_db[index].spent:
-                redeemed_in = outputs_db[index].spent_by_txid()
-            else:
-                redeemed_in = ""
-
             ctx["formattedVout"].append(
                 {
                     "index": index,
                     "address": address,
-                    "transaction": redeemed_in,
+                    "transaction": "",
                     "amount": vout["value"],
                 }
             )
         return ctx
 
 
-class AddressDetailView(DetailView):
+class AddressDetailView(KeysetTableMixin, DetailView):
     model = Address
     slug_field = "address"
     slug_url_kwarg = "address"
+    table_class = AddressActivityTable
+    paginate_by = 17
+    keyset = ("-block", "-id")
+
+    def get_table_data(self):
+        return self.object.activity.select_related("block")
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         address = ctx["address"].address
         ctx["amount_blocks"] = Block.objects.filter(miner=address).count()
-        api = get_client()
-        blocks = api.getinfo().blocks
-        ctx["miner"] = False
-        for perm in api.listpermissions("mine"):
-            if (
-                perm["address"] == address
-                and perm["startblock"] < blocks < perm["endblock"]
-            ):
-                ctx["miner"] = True
-        ctx["admin"] = False
-        for perm in api.listpermissions("admin"):
-            if (
-                perm["address"] == address
-                and perm["startblock"] < blocks < perm["endblock"]
-            ):
-                ctx["admin"] = True
+        permissions = set(
+            Permission.objects.active()
+            .filter(address=address)
+            .values_list("type", flat=True)
+        )
+        ctx["miner"] = Permission.MINE in permissions
+        ctx["admin"] = Permission.ADMIN in permissions
         qs = super().get_queryset()
         ctx["balance"] = qs.with_balance().filter(address=address).first().balance
-        last_out = Output.objects.filter(address=address).order_by(
-            "-transaction__block__time"
-        )[:10]
-        ctx["last_tx"] = []
-        for out in last_out:
-            ctx["last_tx"].append(
-                {
-                    "tx": out.transaction.hash,
-                    "time": out.transaction.block.time,
-                    "hash": out.transaction.block.hash,
-                    "height": out.transaction.block.height,
-                }
-            )
         return ctx
 
 
@@ -269,14 +475,29 @@ class StreamItemDetail(TemplateView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        tx, out_idx = self.kwargs.get("output").split(":")
         stream = self.kwargs.get("stream")
+        try:
+            tx, out_idx = self.kwargs.get("output").split(":")
+            item = StreamItem.objects.filter(
+                stream=stream, txid=tx, vout=int(out_idx)
+            ).first()
+        except (ValueError, ValidationError):
+            raise Http404("Invalid stream item")
         client = get_client()
-        res = client.liststreamtxitems(stream, [tx], verbose=True)[int(out_idx)]
-        res["stream"] = stream
-        ctx["streamitem"] = res
+        if item is None:
+            item = client.liststreamtxitems(stream, [tx], verbose=True)[int(out_idx)]
+            item["stream"] = stream
+            keys = item["keys"]
+        else:
+            keys = item.keys
+        ctx["streamitem"] = item
         if stream == "iscc":
-            iscc_code = "-".join(res["keys"])
+            iscc_code = "-".join(keys)
+            if Stream.objects.filter(name="smart-license").exists():
+                ctx["smartlicenses"] = StreamItem.objects.filter(
+                    stream="smart-license", keys__contains=[iscc_code]
+                )
+                return ctx
             try:
                 smart_licenses = client.liststreamkeyitems(
                     "smart-license", key=iscc_code, verbose=True